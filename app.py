@@ -1,4 +1,5 @@
 from flask import Flask, jsonify, request
+import logging
 from flask_marshmallow import Marshmallow
 from marshmallow import fields, ValidationError
 import mysql.connector
@@ -6,11 +7,14 @@ from mysql.connector import Error
 from password import root_password
 
 from flask_cors import CORS
+from scrape_logging import configure_logging
 
 app = Flask(__name__)
 CORS(app)
 ma = Marshmallow(app)
 
+logger = logging.getLogger(__name__)
+
 class properties_schema(ma.Schema):
     PropertyID = fields.Integer(required=True)
     StreetNumber = fields.String(required=True)
@@ -44,10 +48,11 @@ def get_db_connection():
             host=host,
             port = 3306
         )
-        print("Connected to MySQL database successfully")
+        # Every request connects, so this is only worth seeing when debugging
+        logger.debug("Connected to MySQL database successfully")
         return conn
     except Error as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
         return None
 
 @app.route("/properties", methods=["GET"])
@@ -65,7 +70,7 @@ def get_properties():
         
         return jsonify(properties_multi.dump(properties_data))
     except Exception as e:
-       print(f"Error: {e}")
+       logger.error("Error: %s", e)
        return jsonify({"error": "Internal Server Error"}), 500    
     finally:
         if conn and conn.is_connected():
@@ -88,7 +93,7 @@ def get_property_by_id(PropertyID):
         
         return jsonify(properties.dump(property_data))
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
         return jsonify({"error": "Internal Server Error"}), 500
     finally:
         if conn and conn.is_connected():
@@ -100,7 +105,7 @@ def add_property():
     try:
         existing_property_data = properties.load(request.json)
     except ValidationError as e:
-        print(f"Error: {e}")
+        logger.warning("Validation error: %s", e)
         return jsonify(e.messages), 400
 
     try:
@@ -127,7 +132,7 @@ def add_property():
 
         return jsonify({"message":"New property added successfully"}), 201
     except Error as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
         return jsonify({"error": "Internal Server Error"}), 500
     finally: 
         if conn and conn.is_connected():
@@ -139,7 +144,7 @@ def update_property(PropertyID):
     try:
         existing_property_data = properties_schema().load(request.json)
     except ValidationError as e:
-        print(f"Error: {e}")
+        logger.warning("Validation error: %s", e)
         return jsonify(e.messages), 400
 
     try:
@@ -168,7 +173,7 @@ def update_property(PropertyID):
 
         return jsonify({"message":"Property Updated Successfully"}), 200
     except Error as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
         return jsonify({"error":"Internal Server Error"}), 500
     finally:
         if conn and conn.is_connected():
@@ -180,7 +185,7 @@ def update_property(PropertyID):
     try:
         properties_data = properties_schema(many=True).load(request.json)
     except ValidationError as e:
-        print(f"Error: {e}")
+        logger.warning("Validation error: %s", e)
         return jsonify(e.messages), 400
 
     try:
@@ -210,7 +215,7 @@ def update_property(PropertyID):
 
         return jsonify({"message":"Properties Updated Successfully"}), 200
     except Error as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
         return jsonify({"error":"Internal Server Error"}), 500
     finally:
         if conn and conn.is_connected():
@@ -220,7 +225,7 @@ def update_property(PropertyID):
 
 @app.route("/properties/<int:PropertyID>", methods=["DELETE"])
 def delete_property(PropertyID):
-    print(f"Received DELETE request for PropertyID: {PropertyID}")
+    logger.info("Received DELETE request for PropertyID: %s", PropertyID)
     try:
         conn = get_db_connection()
         if conn is None:
@@ -240,7 +245,7 @@ def delete_property(PropertyID):
 
         return jsonify({"message": "Property removed successfully"}), 201
     except Error as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
         return jsonify({"error": "Internal Server Error"}), 500
     finally:
         if conn and conn.is_connected():
@@ -249,5 +254,6 @@ def delete_property(PropertyID):
         
 
 if __name__ == '__main__':
+    configure_logging()
     app.run(port=5000, debug=True)
 
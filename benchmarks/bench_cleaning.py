@@ -0,0 +1,117 @@
+# Benchmark of cleaning PropertyDetail records in place (cleaning.clean_records, what the scrapers run)
+# against the row-by-row iterrows loop over a DataFrame the batch scraper started with.
+# Run from the repository root:  python -m benchmarks.bench_cleaning --rows 1000000
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from cleaning import clean_records
+from property_record import PropertyDetail
+
+
+# Function to clean up monetary values, as the batch scraper did before
+def clean_up_monetary_value(value):
+    if pd.isna(value):
+        return None
+    cleaned_value = str(value).replace('$', '').replace(',', '')
+    try:
+        return int(cleaned_value)
+    except ValueError:
+        return None
+
+
+# The cleaning loop scrape_data used to run over its DataFrame
+def legacy_clean(df):
+    rows = []
+    for index, row in df.iterrows():
+        row = row.astype(object)  # Newer pandas infers a str dtype for all-text rows
+        if pd.notna(row['Pin']):
+            if isinstance(row['Pin'], str):
+                row['Pin'] = int(row['Pin'].replace('-', ''))
+
+        if pd.notna(row['SquareFootage']):
+            if isinstance(row['SquareFootage'], str):
+                row['SquareFootage'] = int(row['SquareFootage'].replace(',', ''))
+
+        if pd.notna(row['BuildingSquareFootage']):
+            if isinstance(row['BuildingSquareFootage'], str):
+                try:
+                    row['BuildingSquareFootage'] = int(row['BuildingSquareFootage'].replace(',', ''))
+                except ValueError:
+                    row['BuildingSquareFootage'] = None
+
+        for column in ('AssessorValuation', 'AssessorPostAppealValuation', 'PreviousBoardCertified'):
+            if pd.notna(row[column]):
+                if isinstance(row[column], str):
+                    row[column] = clean_up_monetary_value(row[column])
+
+        row_dict = row.to_dict()
+        rows.append({key: (None if pd.isna(value) else value) for key, value in row_dict.items()})
+    return rows
+
+
+# Function to turn the synthetic frame into row dictionaries with None for missing values
+def frame_to_rows(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+# Function to build a frame of scraped-looking text values, with blanks and junk mixed in
+def synthetic_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    pins = rng.integers(10**13, 3 * 10**13, rows).astype(str)
+    dashed = pd.Series(pins).str.replace(r'(\d{2})(\d{2})(\d{3})(\d{3})(\d{4})', r'\1-\2-\3-\4-\5', regex=True)
+
+    def money(low, high):
+        values = pd.Series(rng.integers(low, high, rows)).map('${:,}'.format)
+        # Some pages show cents or leave the field blank
+        values[rng.random(rows) < 0.05] = '$1,234.50'
+        values[rng.random(rows) < 0.05] = None
+        return values
+
+    building = pd.Series(rng.integers(500, 20000, rows)).map('{:,}'.format)
+    building[rng.random(rows) < 0.1] = 'N/A'
+
+    return pd.DataFrame({
+        'Pin': dashed,
+        'Address': '1234 S MICHIGAN AVE',
+        'SquareFootage': pd.Series(rng.integers(500, 50000, rows)).map('{:,}'.format),
+        'BuildingSquareFootage': building,
+        'AssessorValuation': money(1000, 900000),
+        'AssessorPostAppealValuation': money(1000, 900000),
+        'PreviousBoardCertified': money(1000, 900000),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and iterrows cleaning throughput')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='rows in the synthetic frame')
+    parser.add_argument('--legacy-rows', type=int, default=20_000,
+                        help='rows timed with the iterrows loop (extrapolated to --rows)')
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows)
+
+    # Same output as the old loop on a sample
+    sample = df.head(args.legacy_rows)
+    start = time.perf_counter()
+    expected = legacy_clean(sample)
+    legacy_seconds = (time.perf_counter() - start) * args.rows / len(sample)
+    records, rejected = clean_records([PropertyDetail(**row) for row in frame_to_rows(sample)])
+    if [{column: record[column] for column in sample.columns} for record in records] != expected or rejected:
+        raise RuntimeError('record cleaning differs from the iterrows loop')
+
+    records = [PropertyDetail(**row) for row in frame_to_rows(df)]
+    start = time.perf_counter()
+    records, rejected = clean_records(records)
+    record_seconds = time.perf_counter() - start
+
+    print(f'rows:        {args.rows:,}')
+    print(f'iterrows:    {legacy_seconds:8.2f} s (extrapolated from {len(sample):,} rows)')
+    print(f'records:     {record_seconds:8.2f} s ({len(records) / record_seconds:,.0f} rows/sec)')
+    print(f'speedup:     {legacy_seconds / record_seconds:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# End-to-end benchmark of the batch scraper (scrape_data) and the /scrape-property service against a
+# local stand-in for the assessor site, writing to a null database sink or a local MySQL (--db-host).
+# Each scenario runs in its own process so peak RSS is its own. Results are compared with the saved
+# baseline in benchmarks/baselines/e2e.json; a regression makes the run exit with status 1.
+# Run from the repository root:  python -m benchmarks.bench_e2e
+# Record a new baseline:         python -m benchmarks.bench_e2e --save-baseline
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scrape_logging import configure_logging
+from benchmarks.null_db import NullConnection
+from benchmarks.stand_in_server import start_server
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines', 'e2e.json')
+DEFAULT_TOLERANCE = 0.2  # PINs/sec may drop, and p99 rise, by this fraction before it counts as a regression
+
+# (kind, PINs, concurrency)
+SCENARIOS = [
+    ('batch', 200, 4),
+    ('batch', 200, 16),
+    ('batch', 1000, 16),
+    ('service', 200, 1),
+    ('service', 200, 8),
+]
+
+
+def scenario_name(kind, pin_count, concurrency):
+    return f'{kind}-{pin_count}-c{concurrency}'
+
+
+# Function to pick the q-th quantile of a list of values (nearest rank)
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+# Function to scrape the PINs with scrape_data; returns (elapsed, per-PIN latencies, stage seconds, failed)
+def run_batch(pins, concurrency, base_url, connection_factory, max_rate):
+    import data_scrape
+    from metrics import Metrics
+    from rate_limiter import AdaptiveRateLimiter
+
+    # Per-PIN latency: from the start of its fetch (including rate limiting) to the page in hand
+    latencies = []
+    fetch_page = data_scrape.fetch_page
+
+    def timed_fetch_page(pin, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fetch_page(pin, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    data_scrape.fetch_page = timed_fetch_page
+    metrics = Metrics()
+
+    start = time.perf_counter()
+    failed = data_scrape.scrape_data(connection_factory(), concurrency=concurrency, per_host_limit=concurrency,
+                                     base_url=base_url, validators_file=None, pins=pins,
+                                     rate_limiter=AdaptiveRateLimiter(rate=max_rate, max_rate=max_rate),
+                                     connection_factory=connection_factory, metrics=metrics,
+                                     metrics_interval=3600)
+    elapsed = time.perf_counter() - start
+
+    stages = {name: stage['seconds_total'] for name, stage in metrics.snapshot()['stages'].items()}
+    return elapsed, latencies, stages, failed
+
+
+# Function to POST every PIN to /scrape-property from concurrency client threads; same return as run_batch
+def run_service(pins, concurrency, base_url, connection_factory, max_rate):
+    import data_scrape_update as service
+    import http_client
+    import scrape_service
+    from db_executor import DbExecutor
+    from metrics import default_metrics
+    from rate_limiter import AdaptiveRateLimiter, CircuitBreaker
+
+    # Point the service at the stand-in and the benchmark database, with the benchmark's request rate
+    scrape_service.BASE_URL = base_url
+    service.db_executor = DbExecutor(connection_factory, pool_size=concurrency)
+    http_client._default_client = http_client.HttpClient(
+        pool_size=concurrency, rate_limiter=AdaptiveRateLimiter(rate=max_rate, max_rate=max_rate),
+        breaker=CircuitBreaker(), metrics=default_metrics())
+
+    def request_one(pin):
+        client = service.app.test_client()
+        start = time.perf_counter()
+        response = client.post('/scrape-property', json={'pin_number': pin})
+        return response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(request_one, pins))
+    elapsed = time.perf_counter() - start
+
+    stages = {name: stage['seconds_total'] for name, stage in default_metrics().snapshot()['stages'].items()}
+    failed = sum(1 for status, _ in results if status not in (200, 201))
+    return elapsed, [latency for _, latency in results], stages, failed
+
+
+RUNNERS = {'batch': run_batch, 'service': run_service}
+
+
+# Function to run one scenario in the current (fresh) process and put its result on the queue
+def run_scenario(kind, pin_count, concurrency, settings, results):
+    # The services cache pages under the working directory; keep that out of the repository
+    os.chdir(tempfile.mkdtemp(prefix='bench_e2e_'))
+    # Only errors, so injected failures and throttling do not bury the results table
+    configure_logging(level='ERROR')
+
+    server, base_url = start_server(latency=settings['latency'], error_rate=settings['error_rate'],
+                                    throttle_rate=settings['throttle_rate'])
+    if settings['db_host']:
+        from data_scrape import get_db_connection
+        connection_factory = functools.partial(get_db_connection, settings['db_host'])
+    else:
+        connection_factory = functools.partial(NullConnection, settings['write_latency'])
+
+    pins = [str(16000000000000 + i) for i in range(pin_count)]
+    try:
+        elapsed, latencies, stages, failed = RUNNERS[kind](pins, concurrency, base_url, connection_factory,
+                                                           settings['max_rate'])
+    finally:
+        server.shutdown()
+
+    results.put({
+        'pins_per_sec': round(pin_count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stage_seconds': {name: round(seconds, 3) for name, seconds in sorted(stages.items())},
+        'failed': failed or 0,
+    })
+
+
+# Function to run a scenario in a child process; returns its result
+def measure(kind, pin_count, concurrency, settings):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=run_scenario, args=(kind, pin_count, concurrency, settings, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+# Function to list how a result is worse than its baseline
+def regressions(result, baseline, tolerance):
+    problems = []
+    if result['pins_per_sec'] < baseline['pins_per_sec'] * (1 - tolerance):
+        problems.append(f"PINs/sec {baseline['pins_per_sec']} -> {result['pins_per_sec']}")
+    if result['p99_ms'] > baseline['p99_ms'] * (1 + tolerance):
+        problems.append(f"p99 {baseline['p99_ms']}ms -> {result['p99_ms']}ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end scraper benchmark against a local assessor stand-in')
+    parser.add_argument('--scenarios', nargs='+', help='run only these scenarios, e.g. batch-200-c16')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated assessor latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='share of requests answered with a 429 and Retry-After')
+    parser.add_argument('--max-rate', type=float, default=1000.0, help='request rate limit in requests/sec')
+    parser.add_argument('--write-latency', type=float, default=0.002,
+                        help='simulated seconds per statement of the null database sink')
+    parser.add_argument('--db-host', help='write to this local MySQL instead of the null sink')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed fractional slowdown before a scenario counts as a regression')
+    parser.add_argument('--save-baseline', action='store_true', help=f'write the results to {BASELINE_FILE}')
+    args = parser.parse_args()
+
+    settings = {
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate,
+        'max_rate': args.max_rate,
+        'write_latency': args.write_latency,
+        'db_host': args.db_host,
+    }
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            saved = json.load(f)
+        # Results are only comparable under the same settings
+        if saved.get('settings') == settings:
+            baseline = saved['results']
+        else:
+            print('Baseline was recorded with different settings; not comparing')
+
+    print(f'{"scenario":>18}  {"PINs/sec":>8}  {"p50 ms":>7}  {"p99 ms":>7}  {"RSS MB":>6}  {"failed":>6}  stage seconds')
+    results = {}
+    regressed = []
+    for kind, pin_count, concurrency in SCENARIOS:
+        name = scenario_name(kind, pin_count, concurrency)
+        if args.scenarios and name not in args.scenarios:
+            continue
+        result = results[name] = measure(kind, pin_count, concurrency, settings)
+        stages = ', '.join(f'{stage} {seconds}' for stage, seconds in result['stage_seconds'].items())
+        print(f'{name:>18}  {result["pins_per_sec"]:>8}  {result["p50_ms"]:>7}  {result["p99_ms"]:>7}  '
+              f'{result["peak_rss_mb"]:>6}  {result["failed"]:>6}  {stages}')
+        if name in baseline:
+            problems = regressions(result, baseline[name], args.tolerance)
+            if problems:
+                print(f'{"":>18}  REGRESSION: {"; ".join(problems)}')
+                regressed.append(name)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f'Baseline saved to {BASELINE_FILE}')
+    elif regressed:
+        raise SystemExit(f'Regressed: {", ".join(regressed)}')
+
+
+if __name__ == '__main__':
+    main()
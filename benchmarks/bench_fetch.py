@@ -0,0 +1,54 @@
+# Benchmark of the concurrent fetch engine against a local stand-in for the assessor site.
+# Run from the repository root:  python -m benchmarks.bench_fetch --pins 400 --latency 0.1
+import argparse
+import functools
+import time
+
+from data_scrape import scrape_pin
+from fetch_engine import HostLimiter, fetch_concurrently
+from http_client import HttpClient
+from benchmarks.stand_in_server import start_server
+
+
+# Function to scrape every PIN once at the given concurrency and return PINs/sec
+def run(pins, base_url, concurrency, per_host_limit):
+    limiter = HostLimiter(per_host_limit)
+    # Fresh client per run so every page is downloaded rather than answered with a 304
+    client = HttpClient(pool_size=concurrency)
+    fetch_one = functools.partial(scrape_pin, base_url=base_url, limiter=limiter, client=client)
+
+    scraped = 0
+    start = time.perf_counter()
+    for pin, property_data in fetch_concurrently(pins, fetch_one, concurrency):
+        if property_data is not None:
+            scraped += 1
+    elapsed = time.perf_counter() - start
+
+    if scraped != len(pins):
+        raise RuntimeError(f'only {scraped} of {len(pins)} PINs scraped')
+    return len(pins) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PINs/sec of the fetch engine at increasing concurrency')
+    parser.add_argument('--pins', type=int, default=200, help='number of PINs per run')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated server latency in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    server, base_url = start_server(latency=args.latency)
+    pins = [str(16000000000000 + i) for i in range(args.pins)]
+
+    try:
+        print(f'{"concurrency":>11}  {"PINs/sec":>9}  {"speedup":>7}')
+        baseline = None
+        for concurrency in args.concurrency:
+            rate = run(pins, base_url, concurrency, per_host_limit=concurrency)
+            baseline = baseline or rate
+            print(f'{concurrency:>11}  {rate:>9.1f}  {rate / baseline:>6.1f}x')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
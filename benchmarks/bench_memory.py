@@ -0,0 +1,85 @@
+# Memory per parcel of the PropertyDetail records against the row dicts and DataFrame they replaced.
+# Parcels carry the values of benchmarks/pages/sample_property.json, each as its own string objects
+# like a parser produces them.
+# Run from the repository root:  python -m benchmarks.bench_memory --parcels 100000
+import argparse
+import json
+import os
+import tracemalloc
+
+import pandas as pd
+
+from cleaning import clean_records
+from property_record import COLUMN_NAMES, SOURCE_PIN, PropertyDetail
+from benchmarks.stand_in_server import PAGES_DIR
+
+
+# Function to make the scraped text values of one parcel
+def parcel_values(template, index):
+    pin = f'{16000000000000 + index}'
+    values = {column: (value + ' ')[:-1] for column, value in template.items() if value is not None}
+    values['Pin'] = f'{pin[:2]}-{pin[2:4]}-{pin[4:7]}-{pin[7:10]}-{pin[10:]}'
+    values[SOURCE_PIN] = pin
+    return values
+
+
+# The path rows took before: a dict per parsed page, a DataFrame per batch, a dict per cleaned row.
+# The rows are cleaned with the same clean_records as the records, so only the containers differ.
+def legacy_path(template, parcels):
+    parsed = [parcel_values(template, index) for index in range(parcels)]
+    df = pd.DataFrame(parsed, columns=list(COLUMN_NAMES) + [SOURCE_PIN])
+    rows = df.astype(object).where(df.notna(), None).to_dict('records')
+    rows, rejected = clean_records(rows)
+    params = [tuple(row[column] for column in COLUMN_NAMES) for row in rows]
+    return parsed, df, rows, params
+
+
+# The path rows take now: one PropertyDetail per parcel, cleaned in place
+def record_path(template, parcels):
+    records = [PropertyDetail(**parcel_values(template, index)) for index in range(parcels)]
+    records, rejected = clean_records(records)
+    params = [record.as_params() for record in records]
+    return records, params
+
+
+# Function to measure (bytes still held by what build returns, peak bytes while building it)
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return held, peak
+
+
+# Function to measure the bytes held by the parsed parcels alone (no cleaning, no query parameters)
+def parsed_only(make, template, parcels):
+    return measure(lambda: [make(**parcel_values(template, index)) for index in range(parcels)])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory per parcel: PropertyDetail records vs dicts/DataFrames')
+    parser.add_argument('--parcels', type=int, default=100_000, help='parcels held in memory')
+    args = parser.parse_args()
+
+    with open(os.path.join(PAGES_DIR, 'sample_property.json'), encoding='utf-8') as f:
+        template = json.load(f)
+
+    dict_held = parsed_only(dict, template, args.parcels)
+    record_held = parsed_only(PropertyDetail, template, args.parcels)
+    legacy_held, legacy_peak = measure(lambda: legacy_path(template, args.parcels))
+    record_path_held, record_path_peak = measure(lambda: record_path(template, args.parcels))
+
+    mb = 1024 ** 2
+    print(f'parcels: {args.parcels:,}')
+    print(f'{"":>26}  {"dicts/DataFrame":>15}  {"PropertyDetail":>14}  {"saved":>6}')
+    for label, before, after in (
+        ('parsed parcels held (MB)', dict_held, record_held),
+        ('parse..params held (MB)', legacy_held, record_path_held),
+        ('parse..params peak (MB)', legacy_peak, record_path_peak),
+    ):
+        print(f'{label:>26}  {before / mb:>15.1f}  {after / mb:>14.1f}  {1 - after / before:>6.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Golden-file check and parse throughput of the extractor backends on saved assessor pages.
+# Every backend must reproduce benchmarks/pages/<page>.json exactly before it is timed.
+# Run from the repository root:  python -m benchmarks.bench_parse
+# After adding a page, write its golden file with the reference backend:  --update-golden
+import argparse
+import glob
+import json
+import os
+import time
+
+from extractor import BACKENDS, parse_property_page
+from property_record import COLUMN_NAMES
+from benchmarks.stand_in_server import PAGES_DIR
+
+REFERENCE_BACKEND = 'html.parser'  # The BeautifulSoup tree the scrapers were written against
+GOLDEN_PIN = '00000000000000'
+
+
+# Function to load every saved page as (name, html_text)
+def load_pages():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(PAGES_DIR, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+    return pages
+
+
+def golden_path(name):
+    return os.path.join(PAGES_DIR, f'{name}.json')
+
+
+# Function to compare every backend with the golden files; returns the backends that disagree
+def check_golden(pages, backends):
+    failures = []
+    for name, html_text in pages:
+        with open(golden_path(name), encoding='utf-8') as f:
+            # Columns missing from a golden file were not on the page
+            expected = dict.fromkeys(COLUMN_NAMES)
+            expected.update(json.load(f))
+        for backend in backends:
+            actual = parse_property_page(html_text, GOLDEN_PIN, backend).to_dict()
+            if actual != expected:
+                print(f'MISMATCH {backend} on {name}.html')
+                for column in sorted(set(expected) | set(actual)):
+                    if expected.get(column) != actual.get(column):
+                        print(f'    {column}: expected {expected.get(column)!r}, got {actual.get(column)!r}')
+                failures.append(backend)
+    return failures
+
+
+# Function to time parse_property_page over the pages; returns pages/sec
+def throughput(pages, backend, seconds):
+    parsed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for name, html_text in pages:
+            parse_property_page(html_text, GOLDEN_PIN, backend)
+            parsed += 1
+    return parsed / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extractor backend golden check and throughput')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--seconds', type=float, default=3.0, help='time spent parsing per backend')
+    parser.add_argument('--update-golden', action='store_true',
+                        help=f'rewrite the golden files from the {REFERENCE_BACKEND} backend')
+    args = parser.parse_args()
+
+    pages = load_pages()
+
+    if args.update_golden:
+        for name, html_text in pages:
+            expected = parse_property_page(html_text, GOLDEN_PIN, REFERENCE_BACKEND).to_dict()
+            with open(golden_path(name), 'w', encoding='utf-8') as f:
+                json.dump(expected, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+        print(f'Wrote {len(pages)} golden files')
+        return
+
+    failures = check_golden(pages, args.backends)
+    if failures:
+        raise SystemExit(f'Golden check failed for: {", ".join(sorted(set(failures)))}')
+    print(f'Golden check passed: {len(pages)} pages x {len(args.backends)} backends')
+
+    print(f'{"backend":>12}  {"pages/sec":>9}')
+    for backend in args.backends:
+        print(f'{backend:>12}  {throughput(pages, backend, args.seconds):>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Parse throughput of the process-pool parse stage from 1 to N processes, against parsing in threads.
+# The recorded pages in benchmarks/pages are cycled through the same pipeline stage data_scrape.py builds.
+# Run from the repository root:  python -m benchmarks.bench_parse_pool --pages 5000
+import argparse
+import time
+
+from extractor import BACKENDS, DEFAULT_BACKEND, parse_property_page
+from parse_pool import CHUNK_TIMEOUT, DEFAULT_CHUNK_SIZE, ParsePool, available_cores
+from pipeline import Stage, run_pipeline
+from benchmarks.bench_parse import load_pages
+
+
+# Function to make `count` (PIN, page) pairs from the recorded pages
+def workload(pages, count):
+    return [(f'{16000000000000 + index}', pages[index % len(pages)][1]) for index in range(count)]
+
+
+# Function to time a parse stage over the workload; returns pages/sec
+def run_stage(items, stage):
+    parsed = []
+    start = time.perf_counter()
+    run_pipeline(iter(items), [stage, Stage('collect', parsed.append)])
+    elapsed = time.perf_counter() - start
+    if len(parsed) != len(items):
+        raise SystemExit(f'{stage.name}: {len(parsed)} of {len(items)} pages parsed')
+    return len(items) / elapsed
+
+
+# The in-process stage: `workers` threads, all sharing the GIL
+def thread_throughput(items, backend, workers):
+    def parse(item):
+        pin, html_text = item
+        return parse_property_page(html_text, pin, backend)
+
+    return run_stage(items, Stage('parse', parse, workers=workers))
+
+
+# The process-pool stage, as data_scrape.py runs it with --parse-processes
+def pool_throughput(items, backend, processes, chunk_size):
+    with ParsePool(processes, backend=backend, chunk_size=chunk_size) as pool:
+        # Start every process (and its imports) before the clock does
+        for _ in range(processes):
+            pool.parse_chunk(items[:1])
+        return run_stage(items, Stage('parse', pool.parse_chunk, workers=2 * processes,
+                                      batch_size=chunk_size, batch_timeout=CHUNK_TIMEOUT, expand=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse throughput from 1 to N parse processes')
+    parser.add_argument('--pages', type=int, default=3000, help='pages parsed per scenario')
+    parser.add_argument('--max-processes', type=int, default=available_cores(),
+                        help='largest pool measured (default: the cores available)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='pages per pool task')
+    parser.add_argument('--threads', type=int, default=2, help='threads of the in-process baseline')
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND)
+    args = parser.parse_args()
+
+    items = workload(load_pages(), args.pages)
+    print(f'{args.pages} pages, {args.backend} backend, {available_cores()} cores available, '
+          f'chunks of {args.chunk_size}')
+    print(f'{"scenario":>14}  {"pages/sec":>9}  {"vs threads":>10}')
+
+    baseline = thread_throughput(items, args.backend, args.threads)
+    print(f'{f"threads-{args.threads}":>14}  {baseline:>9.0f}  {1:>9.2f}x')
+    for processes in range(1, args.max_processes + 1):
+        rate = pool_throughput(items, args.backend, processes, args.chunk_size)
+        print(f'{f"processes-{processes}":>14}  {rate:>9.0f}  {rate / baseline:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
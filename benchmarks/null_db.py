@@ -0,0 +1,66 @@
+# A database target that accepts every statement and stores nothing, for benchmarks without MySQL.
+# write_latency simulates the round trip of each statement.
+import itertools
+import time
+
+
+class NullCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        self.connection.statement()
+        self.rowcount = 0
+        self.lastrowid = next(self.connection.ids)
+
+    def executemany(self, query, seq_params):
+        self.connection.statement()
+        self.rowcount = len(list(seq_params))
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def fetchmany(self, size=1):
+        return []
+
+    def close(self):
+        pass
+
+
+class NullConnection:
+    def __init__(self, write_latency=0.0):
+        self.write_latency = write_latency
+        self.autocommit = True
+        self.statements = 0
+        self.ids = itertools.count(1)
+
+    def statement(self):
+        self.statements += 1
+        if self.write_latency:
+            time.sleep(self.write_latency)
+
+    def cursor(self, *args, **kwargs):
+        return NullCursor(self)
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def reconnect(self, *args, **kwargs):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+
+# Function to format a 14 digit PIN the way the assessor site displays it
+def dashed_pin(pin):
+    pin = pin.ljust(14, '0')
+    return f'{pin[0:2]}-{pin[2:4]}-{pin[4:7]}-{pin[7:10]}-{pin[10:14]}'
+
+
+# Local stand-in for cookcountyassessor.com serving a recorded page for every /pin/<PIN> request.
+# A share of requests can fail: error_rate with a 500, throttle_rate with a 429 and Retry-After.
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, latency=0.0, page_path=None, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        with open(page_path or os.path.join(PAGES_DIR, 'sample_property.html'), encoding='utf-8') as f:
+            self.template = f.read()
+        super().__init__(address, StandInHandler)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, delayed ACKs add ~40ms to each response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if not self.path.startswith('/pin/'):
+            self.send_error(404)
+            return
+
+        with self.server.random_lock:
+            roll = self.server.random.random()
+        if roll < self.server.error_rate:
+            self.send_empty(500)
+            return
+        if roll < self.server.error_rate + self.server.throttle_rate:
+            self.send_empty(429, {'Retry-After': str(self.server.retry_after)})
+            return
+
+        pin = self.path[len('/pin/'):].split('#')[0]
+        body = self.server.template.replace('__PIN__', dashed_pin(pin)).encode('utf-8')
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_empty(304, {'ETag': etag})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+
+# Function to start the stand-in server on a free local port; returns (server, base_url)
+def start_server(latency=0.0, page_path=None, error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=0):
+    server = StandInServer(('127.0.0.1', 0), latency=latency, page_path=page_path, error_rate=error_rate,
+                           throttle_rate=throttle_rate, retry_after=retry_after, seed=seed)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    return server, f'http://{host}:{port}/pin/'
@@ -0,0 +1,47 @@
+import re
+
+# Text int() accepts: optional sign and surrounding whitespace
+INTEGER_PATTERN = r'\s*[+-]?\d+\s*'
+_INTEGER_RE = re.compile(INTEGER_PATTERN)
+
+# Columns dropped from the batch when they hold text that is not a number (int() raised here before)
+STRICT_INTEGER_COLUMNS = {'Pin': '-', 'SquareFootage': ','}
+# Columns set to NULL when they hold text that is not a number
+LENIENT_INTEGER_COLUMNS = {'BuildingSquareFootage': ','}
+# Monetary columns: '$' and ',' removed, anything that is not a whole number becomes NULL
+MONETARY_COLUMNS = ['AssessorValuation', 'AssessorPostAppealValuation', 'PreviousBoardCertified']
+
+
+# Function to convert one text value to an integer; returns (value, ok).
+# Values that are not text are left as they are, like the isinstance(str) checks did.
+def _to_integer(value, strip_chars):
+    if not isinstance(value, str):
+        return value, True
+    for char in strip_chars:
+        value = value.replace(char, '')
+    if _INTEGER_RE.fullmatch(value):
+        return int(value), True
+    return None, False
+
+
+# Function to clean PropertyDetail records in place. Records whose Pin or SquareFootage is text that
+# does not convert to an integer are rejected. Returns (kept records, rejected records).
+def clean_records(records):
+    kept = []
+    rejected = []
+    for record in records:
+        valid = True
+        for column, strip_chars in STRICT_INTEGER_COLUMNS.items():
+            value, ok = _to_integer(record[column], strip_chars)
+            if ok:
+                record[column] = value
+            valid = valid and ok
+
+        for column, strip_chars in LENIENT_INTEGER_COLUMNS.items():
+            record[column] = _to_integer(record[column], strip_chars)[0]
+
+        for column in MONETARY_COLUMNS:
+            record[column] = _to_integer(record[column], '$,')[0]
+
+        (kept if valid else rejected).append(record)
+    return kept, rejected
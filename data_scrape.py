@@ -1,14 +1,46 @@
 import mysql.connector
 from mysql.connector import Error
-import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+import argparse
+import functools
+import logging
+import multiprocessing
+import os
+import tempfile
 import time
+import extractor
+from extractor import BACKENDS, DEFAULT_BACKEND
+from fetch_engine import HostLimiter, fetch_concurrently, DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT
+from pipeline import Stage, run_pipeline, DEFAULT_QUEUE_SIZE
+from parse_pool import ParsePool, CHUNK_TIMEOUT, DEFAULT_CHUNK_SIZE, default_process_count
+from cleaning import clean_records
+from db_executor import DbExecutor
+from export_snapshot import SnapshotExport, FORMATS, DEFAULT_FORMAT, DEFAULT_PARTITION_BY
+from staging_load import StagingLoad, LOAD_METHODS, DEFAULT_LOAD_METHOD, STAGING_BATCH_SIZE
+from metrics import Metrics, SnapshotReporter, serve_metrics, DEFAULT_SNAPSHOT_INTERVAL
+from property_upsert import upsert_rows, DEFAULT_BATCH_SIZE
+from property_record import SOURCE_PIN
+from page_cache import PageCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from scrape_state import (ScrapeStateRecorder, ensure_scrape_state_table, iter_worklist, estimate_property_count,
+                          start_run, finish_run, DEFAULT_MAX_AGE_DAYS, DEFAULT_DUE_MAX_AGE_DAYS,
+                          DEFAULT_LOOKAHEAD_YEARS)
+from shard_lease import (ShardHeartbeat, claim_shard, complete_shard, default_owner, ensure_shards,
+                         release_shard, reset_shards, DEFAULT_LEASE_SECONDS)
+from rate_limiter import (AdaptiveRateLimiter, CircuitBreaker, RetryLaterError, RetryQueue, RETRY_LATER,
+                          retryable_status)
+from http_client import HttpClient, ValidatorStore, NOT_MODIFIED, VALIDATORS_FILE, default_client
+from scrape_logging import SUMMARY, configure_logging, pin_extra, DEFAULT_LEVEL, DEFAULT_SAMPLE_RATE
 from password import cloud_password  # Import your database password here
 
-# Function to establish database connection
-def get_db_connection():
-    host = '148.72.118.86'  # Replace with your database host
+# URL base for fetching property details
+BASE_URL = 'https://www.cookcountyassessor.com/pin/'
+
+DB_HOST = '148.72.118.86'  # Replace with your database host
+
+logger = logging.getLogger(__name__)
+
+# Function to establish database connection; options are passed on to mysql.connector.connect
+def get_db_connection(host=DB_HOST, **options):
     database = 'vacancy_abatement'  # Replace with your database name
     user = 'dprice'  # Replace with your database username
     password = cloud_password  # Replace with your database password
@@ -23,293 +55,614 @@ def get_db_connection():
             autocommit=True,  # Ensure autocommit is enabled
             connection_timeout=300,  # Increase timeout to handle long queries
             pool_size=5,  # Adjust pool size as needed
-            buffered=True  # Use buffered cursor
+            buffered=True,  # Use buffered cursor
+            **options
         )
-        print("Connected to MySQL database successfully")
+        logger.info("Connected to MySQL database successfully")
         return connection
     except Error as e:
-        print(f"Error: {e}")
+        logger.error("Error: %s", e)
         return None
 
-# Function to clean up monetary values
-def clean_up_monetary_value(value):
-    if pd.isna(value):  # Check if the value is NaN
-        return None
-    else:
-        # Convert to string and remove dollar sign ($) and commas (,)
-        cleaned_value = str(value).replace('$', '').replace(',', '')
-        try:
-            # Convert cleaned value to float (handles cases like '0.00' and '12,345.67')
-            cleaned_value = int(cleaned_value)
-        except ValueError:
-            # If value cannot be converted to float, return None
-            return None
-        return cleaned_value
-
-# Function to execute query with retry logic
-def execute_query_with_retry(connection, query, params):
-    retry_attempts = 3  # Number of retry attempts
-    retry_delay = 5  # Delay in seconds between retries
-
-    for attempt in range(retry_attempts):
-        try:
-            cursor = connection.cursor()
-            cursor.execute(query, params)
-            print("Query executed successfully")
-            return True  # Return True on success
-
-        except mysql.connector.Error as e:
-            print(f"Attempt {attempt+1}: Error executing query: {e}")
-            if attempt < retry_attempts - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                connection.reconnect()  # Reconnect to MySQL server
-            else:
-                print("Query execution failed after multiple attempts")
-                return False  # Return False on failure
+# Function to pad PIN with zeros to ensure it is 14 digits long
+def pad_pin(pin):
+    if len(pin) == 10:
+        return pin + '0000'
+    return pin
+
+# Function to extract property details from an assessor page into a PropertyDetail
+def parse_property_page(html_text, pin, backend=DEFAULT_BACKEND):
+    return extractor.parse_property_page(html_text, pin, backend)
+
+# Function to fetch the assessor page for a single PIN
+# Returns the page HTML, NOT_MODIFIED when the page is unchanged since the last run,
+# RETRY_LATER when the site is throttling or failing, or None
+def fetch_page(pin, base_url=BASE_URL, limiter=None, client=None, page_cache=None):
+    client = client or default_client()
+    padded_pin = pad_pin(pin)
+    url = f'{base_url}{padded_pin}#address'
+    logger.debug("Fetching data for PIN: %s", padded_pin, extra=pin_extra(pin))
 
-# Function to scrape data and insert/update database
-def scrape_data(connection):
+    try:
+        if limiter is not None:
+            with limiter.slot(url):
+                response = client.get(url, key=padded_pin)
+        else:
+            response = client.get(url, key=padded_pin)
+
+        # Unchanged pages skip the download and the parse
+        if response is NOT_MODIFIED:
+            return NOT_MODIFIED
+
+        # Check if the request was successful
+        if response.status_code == 200:
+            # Keep the raw page so later fixes can be backfilled without the network
+            if page_cache is not None:
+                page_cache.put(pin, response.text)
+            return response.text
+
+        logger.info("Failed to retrieve page for PIN %s, status code: %d", pin, response.status_code,
+                    extra=pin_extra(pin))
+        if retryable_status(response.status_code):
+            return RETRY_LATER
+
+    except RetryLaterError:
+        return RETRY_LATER
+
+    except requests.RequestException as e:
+        logger.info("Request failed for PIN %s: %s", pin, e, extra=pin_extra(pin))
+        return RETRY_LATER
+
+    return None
+
+# Function to fetch and parse the assessor page for a single PIN
+# Returns NOT_MODIFIED when the page is unchanged since the last run, RETRY_LATER on a temporary failure
+def scrape_pin(pin, base_url=BASE_URL, limiter=None, client=None, backend=DEFAULT_BACKEND):
+    html_text = fetch_page(pin, base_url=base_url, limiter=limiter, client=client)
+    if html_text is None or html_text is NOT_MODIFIED or html_text is RETRY_LATER:
+        return html_text
+    return parse_property_page(html_text, pin, backend)
+
+# Function to clean up PIN, square footage and monetary values of a batch of scraped rows.
+# Rows that are rejected are logged, and added to the `rejected` list when one is given.
+def clean_batch(rows, rejected=None):
+    # Records are cleaned in place; every column of the query already has a value, missing ones None
+    rows, rejected_rows = clean_records(rows)
+    for row in rejected_rows:
+        logger.info("Skipping row with invalid PIN or square footage: %s", row.Pin, extra=pin_extra(row.Pin))
+    if rejected is not None:
+        rejected.extend(rejected_rows)
+    return rows
+
+# Function to scrape data and insert/update database.
+# PINs stream through fetch -> parse -> clean -> write stages with bounded queues between them,
+# so rows reach MySQL while scraping continues and memory does not grow with the PIN count.
+def scrape_data(connection, concurrency=DEFAULT_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                base_url=BASE_URL, validators_file=VALIDATORS_FILE, parse_workers=2, clean_workers=1,
+                write_workers=1, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                parser_backend=DEFAULT_BACKEND, page_cache=None, reparse_from_cache=False,
+                incremental=False, max_age_days=DEFAULT_MAX_AGE_DAYS, due_max_age_days=DEFAULT_DUE_MAX_AGE_DAYS,
+                lookahead_years=DEFAULT_LOOKAHEAD_YEARS, connection_factory=None, resume=False,
+                shard=None, resume_since=None, metrics=None, metrics_file=None,
+                metrics_interval=DEFAULT_SNAPSHOT_INTERVAL, pins=None, rate_limiter=None, snapshot=None,
+                full_refresh=False, load_method=DEFAULT_LOAD_METHOD, spool_dir=None, parse_processes=0,
+                parse_chunk_size=DEFAULT_CHUNK_SIZE, parse_pool=None, stop=None):
     if connection is None:
-        print("Database connection is not available")
+        logger.error("Database connection is not available")
         return
 
-    try:
-        cursor = connection.cursor()
-
-        # Fetch PIN numbers from properties table
-        cursor.execute("SELECT PIN FROM properties;")
-        pin_results = cursor.fetchall()
+    connection_factory = connection_factory or get_db_connection
+    # Stage timings, HTTP status codes, retries and progress; see --metrics-file and --metrics-port
+    metrics = metrics or Metrics()
 
-        # Extract PINs from result set 
-        pin_numbers = [str(row[0]) for row in pin_results]
-        
+    if reparse_from_cache and page_cache is None:
+        logger.error("Reparsing from cache needs a page cache")
+        return
 
-        # URL base for fetching property details
-        base_url = 'https://www.cookcountyassessor.com/pin/'
+    # A snapshot replaces the last one, so it must hold every PIN, not just the ones this run picked
+    if snapshot is not None and (incremental or resume or resume_since is not None or shard is not None
+                                 or reparse_from_cache):
+        logger.error("A snapshot needs a run over every PIN, not an incremental, resumed, sharded or cached one")
+        return
 
-        # List to store all property data dictionaries
-        all_data = []
+    try:
+        client = None
+        state = None
+        executor = None
+        run_id = None
+        staging = None
+        own_parse_pool = None
+        fetch_failures = []
+        parse_failures = []
+        rejected_rows = []
+        # (missing, fingerprint of the stored row) of every PIN between the worklist and the write stage
+        known_rows = {}
+
+        if reparse_from_cache:
+            # Rebuild property_details from the newest cached page of every PIN, without the network
+            def cached_pages():
+                for pin, html_text in page_cache.iter_latest():
+                    metrics.inc('pins_done_total')
+                    yield pin, html_text
+
+            pages = cached_pages()
+        else:
+            # PINs to scrape: all of them, or only new, missing, stale and soon-due ones
+            ensure_scrape_state_table(connection)
+            state = ScrapeStateRecorder()
+            # Every stored PIN is checkpointed in the same transaction as its row, so a resumed run
+            # skips exactly the PINs the interrupted one committed. A shard's lease tracks its own progress.
+            if pins is not None:
+                # An explicit list of PINs (e.g. from a benchmark) replaces the worklist query
+                worklist = [(str(pin), False, None) for pin in pins]
+                metrics.set_total(len(worklist))
+            else:
+                if shard is None:
+                    run_id, resume_since = start_run(connection, resume=resume)
+                # Streamed a page at a time on the caller's connection while fetching is under way
+                worklist = iter_worklist(connection, incremental=incremental, max_age_days=max_age_days,
+                                         due_max_age_days=due_max_age_days, lookahead_years=lookahead_years,
+                                         resume_since=resume_since, shard=shard)
+                # Counting the worklist would cost a full scan; a full run's size is the table's row estimate
+                if not incremental and resume_since is None and shard is None:
+                    metrics.set_total(estimate_property_count(connection))
+            logger.info("Streaming PINs to scrape" + (f" in shard {shard:04d}" if shard is not None else ""))
+
+            # Keep several requests in flight, with at most per_host_limit against the assessor site
+            limiter = HostLimiter(per_host_limit)
+            # Pooled keep-alive connections; pages unchanged since the last run come back as 304s.
+            # The request rate adapts to the site's latency and 429/503s; the breaker stops us hammering a failing site.
+            # While it is open the fetch workers wait for it, so the worklist pauses instead of draining into
+            # the retry queue, and an outage does not use up the PINs' retry attempts.
+            validators = ValidatorStore(validators_file)
+            breaker = CircuitBreaker()
+            client = HttpClient(pool_size=concurrency, validators=validators,
+                                rate_limiter=rate_limiter or AdaptiveRateLimiter(), breaker=breaker, metrics=metrics,
+                                wait=True)
+            retry_queue = RetryQueue()
+            fetch_one = functools.partial(fetch_page, base_url=base_url, limiter=limiter, client=client,
+                                          page_cache=page_cache)
+
+            # Once stop is set (a shard worker lost its lease) no new PINs are taken; those in flight are still stored
+            def pin_numbers():
+                for pin, missing, content_hash in worklist:
+                    if stop is not None and stop.is_set():
+                        logger.warning("Stopping: no new PINs are taken" +
+                                       (f" from shard {shard:04d}" if shard is not None else ""))
+                        return
+                    known_rows[pin] = (missing, content_hash)
+                    # A PIN with no property_details row must be downloaded even if the page is unchanged,
+                    # and a full refresh or a snapshot (which needs every row) downloads every page
+                    if missing or full_refresh or snapshot is not None:
+                        validators.forget(pad_pin(pin))
+                    yield pin
+
+            # Fetch stage: the fetch engine keeps `concurrency` requests in flight.
+            # PINs that failed temporarily are fetched again in later rounds, with backoff.
+            def fetched_pages():
+                pins = pin_numbers()
+                while True:
+                    for pin, html_text in fetch_concurrently(pins, fetch_one, concurrency):
+                        if html_text is RETRY_LATER and retry_queue.put(pin):
+                            metrics.inc('retries_total', stage='fetch')
+                            continue
+
+                        metrics.inc('pins_done_total')
+                        if html_text is None and staging is not None and snapshot is None:
+                            # The page is gone for good (a 404 or another status that is not retried):
+                            # a full refresh keeps the PIN's current row rather than deleting it
+                            logger.warning("No page for PIN %s, keeping its current row", pin, extra=pin_extra(pin))
+                            metrics.inc('pins_carried_over_total')
+                            staging.carry_over(pad_pin(pin))
+                            known_rows.pop(pin, None)
+                        elif html_text is RETRY_LATER or html_text is None:
+                            if html_text is RETRY_LATER:
+                                logger.warning("Giving up on PIN %s", pin, extra=pin_extra(pin))
+                            metrics.inc('pins_failed_total')
+                            fetch_failures.append(pin)
+                            known_rows.pop(pin, None)
+                        elif html_text is NOT_MODIFIED:
+                            metrics.inc('pins_unchanged_total')
+                            state.mark_unchanged(pin)
+                            known_rows.pop(pin, None)
+                        else:
+                            yield pin, html_text
+
+                    if not len(retry_queue):
+                        return
+                    if stop is not None and stop.is_set():
+                        logger.warning("Stopping: %d PINs are not retried", len(retry_queue))
+                        return
+                    logger.info("Retrying %d PINs", len(retry_queue))
+                    time.sleep(breaker.retry_in())
+                    pins = retry_queue.take()
+
+            pages = fetched_pages()
+
+        def parse(item):
+            pin, html_text = item
+            property_data = parse_property_page(html_text, pin, parser_backend)
+            property_data[SOURCE_PIN] = pin
+            return property_data
+
+        # With parse processes, pages go to the pool parse_chunk_size at a time and their records come back
+        # one by one; pages that failed to parse (or were lost with a dead process) are counted here
+        def parse_chunk(items):
+            try:
+                records = parse_pool.parse_chunk(items)
+            except Exception as e:
+                logger.warning("Parse process failed on %d pages: %s", len(items), e)
+                records = [None] * len(items)
+            for (pin, _), record in zip(items, records):
+                if record is None:
+                    parse_failures.append(pin)
+                    known_rows.pop(pin, None)
+                    metrics.inc('stage_errors_total', stage='parse')
+            return records
+
+        if parse_processes and parse_pool is None:
+            # A caller scraping several times (a shard worker) passes its pool, so the processes start once
+            parse_pool = own_parse_pool = ParsePool(parse_processes, backend=parser_backend,
+                                                    chunk_size=parse_chunk_size)
+        if parse_pool is not None:
+            # Two threads per process, so a process has its next chunk while the last one is unpickled
+            parse_stage = Stage('parse', parse_chunk, workers=2 * parse_pool.processes, queue_size=queue_size,
+                                batch_size=parse_pool.chunk_size, batch_timeout=CHUNK_TIMEOUT, expand=True)
+        else:
+            parse_stage = Stage('parse', parse, workers=parse_workers, queue_size=queue_size)
+
+        # Writers share a pool with a connection each. The caller's connection is one of them only when
+        # it is not busy reading the worklist.
+        executor = DbExecutor(connection_factory, pool_size=write_workers,
+                              connections=[connection] if reparse_from_cache else [])
+        metrics.add_collector(lambda: {
+            'db_retries_total': executor.stats.retries,
+            'db_reconnects_total': executor.stats.reconnects,
+            'db_transient_errors_total': executor.stats.transient_errors,
+            'db_permanent_errors_total': executor.stats.permanent_errors,
+        })
+
+        # A full refresh goes to a staging table that is swapped in at the end; nothing touches the live one
+        if full_refresh:
+            staging = StagingLoad(executor, method=load_method, spool_dir=spool_dir)
+            staging.begin(connection)
+            # Its scrape state goes to a copy of the state table that is swapped in with the rows
+            state = ScrapeStateRecorder(staging.state_table)
+
+        written_rows = []
+        failed_rows = []
+
+        # Function to split a batch into rows to write and rows identical to the stored ones, by fingerprint.
+        # A full refresh writes everything: its staging table starts empty.
+        def changed_rows(rows):
+            changed = []
+            for row in rows:
+                missing, content_hash = known_rows.pop(row[SOURCE_PIN], (True, None))
+                if missing:
+                    metrics.inc('rows_new_total')
+                elif content_hash is None or content_hash != row.fingerprint() or staging is not None:
+                    metrics.inc('rows_changed_total')
+                else:
+                    metrics.inc('rows_unchanged_total')
+                    state.mark_unchanged(row[SOURCE_PIN])
+                    continue
+                changed.append(row)
+            return changed
+
+        # Rejected rows are only logged in an upsert run, which leaves their stored rows alone. A full refresh
+        # or a snapshot would drop those rows, so there they count as failures.
+        def clean(rows):
+            rejected = []
+            rows = clean_batch(rows, rejected)
+            for row in rejected:
+                known_rows.pop(row[SOURCE_PIN], None)
+            rejected_rows.extend(rejected)
+            metrics.inc('rows_rejected_total', len(rejected))
+            return rows
+
+        # Batched multi-row upsert, one transaction per batch; rows that would not change are skipped
+        def write(rows):
+            changed = changed_rows(rows) if state is not None else rows
+            if staging is not None:
+                failed = staging.write(changed, on_batch=state.record if state else None)
+            else:
+                failed = upsert_rows(executor, changed, batch_size=batch_size,
+                                     on_batch=state.record if state else None)
+            failed_rows.extend(failed)
+            written_rows.append(len(changed) - len(failed))
+            # Stored rows (and unchanged ones) also go to the columnar snapshot, straight from the records
+            if snapshot is not None:
+                failed_ids = {id(row) for row in failed}
+                snapshot.add([row.as_params() for row in rows if id(row) not in failed_ids])
+            metrics.inc('rows_written_total', len(changed) - len(failed))
+            metrics.inc('rows_failed_total', len(failed))
+            logger.info("Batch of %d rows: %d inserted/updated, %d unchanged, %d failed", len(rows),
+                        len(changed) - len(failed), len(rows) - len(changed), len(failed))
+            return rows
+
+        with SnapshotReporter(metrics, metrics_file, metrics_interval):
+            stages = run_pipeline(pages, [
+                parse_stage,
+                Stage('clean', clean, workers=clean_workers, queue_size=queue_size, batch_size=batch_size),
+                Stage('write', write, workers=write_workers, queue_size=queue_size),
+            ], metrics=metrics)
+
+        failed = (sum(stage.errors for stage in stages) + len(failed_rows) + len(fetch_failures)
+                  + len(parse_failures))
+        if staging is not None or snapshot is not None:
+            failed += len(rejected_rows)
+        logger.info("Data insertion/update completed: %d rows written, %d failed", sum(written_rows), failed,
+                    extra=SUMMARY)
+        if state is not None:
+            logger.info("Rows: %d new, %d changed, %d unchanged (%d pages not modified, %d with the same content)",
+                        metrics.counter('rows_new_total'), metrics.counter('rows_changed_total'),
+                        metrics.counter('pins_unchanged_total') + metrics.counter('rows_unchanged_total'),
+                        metrics.counter('pins_unchanged_total'), metrics.counter('rows_unchanged_total'),
+                        extra=SUMMARY)
+
+        # Before a full refresh's swap, which takes its state table with it
+        if state is not None:
+            state.flush(connection)
+
+        if staging is not None:
+            # Swap only a complete refresh in; otherwise the live table stays as it was
+            if failed == 0:
+                try:
+                    staging.finish(connection)
+                except Exception:
+                    staging.rollback(connection)
+                    raise
+            else:
+                staging.rollback(connection)
+            staging = None
 
-        # Iterate over each PIN number
-        for pin in pin_numbers:
-    # Pad PIN with zeros to ensure it is 14 digits long
-            if len(pin) == 10:
-                padded_pin = pin + '0000'
+        if run_id is not None:
+            # A run with failures stays open so --resume retries just the PINs that were not stored
+            if failed == 0:
+                finish_run(connection, run_id)
             else:
-                padded_pin = pin
+                logger.warning("Run %s left open, rerun with --resume to retry what failed", run_id, extra=SUMMARY)
 
-            url = f'{base_url}{padded_pin}#address'
-            print(f"Fetching data for PIN: {padded_pin}")
+        logger.info(executor.stats.summary(), extra=SUMMARY)
+        if client is not None:
+            logger.info(client.summary(), extra=SUMMARY)
+            # Only remember validators once the rows they describe are stored
+            if failed == 0:
+                validators.save()
 
+        return failed
+
+    except Error as e:
+        logger.error("Error inserting/updating data into MySQL database: %s", e)
+        if staging is not None:
             try:
-                response = requests.get(url)
-
-                # Check if the request was successful
-                if response.status_code == 200:
-                    html_text = response.text
-                    soup = BeautifulSoup(html_text, 'html.parser')
-
-                    # Dictionary to store property details
-                    property_data = {}
-                    property_data['Pin'] = pin  # Store PIN in data
-
-                    # Mapping of web page labels to database columns
-                    label_to_column = {
-                        'Pin':'Pin',
-                        'Address': 'Address',
-                        'City': 'City',
-                        'Township': 'Township',
-                        'Property Classification': 'PropertyClassification',
-                        'Square Footage (Land)': 'SquareFootage',
-                        'Neighborhood': 'Neighborhood',
-                        'Taxcode': 'Taxcode',
-                        'Next Scheduled Reassessment': 'NextScheduledReassessment',
-                        'Description': 'Description',
-                        'Age': 'Age',
-                        'Building Square Footage': 'BuildingSquareFootage',
-                        'Assessment Phase': 'AssessmentPhase',
-                        'Previous Board Certified': 'PreviousBoardCertified',
-                        'Status': 'Status',
-                        'Assessor Valuation': 'AssessorValuation',
-                        'Assessor Post-Appeal Valuation': 'AssessorPostAppealValuation',
-                        'Appeal Number': 'AppealNumber',
-                        'Attorney/Tax Representative': 'AttorneyTaxRepresentative',
-                        'Applicant': 'Applicant',
-                        'Result': 'Result',
-                        'Reason': 'Reason',
-                        'Tax Year': 'TaxYear',
-                        'Certificate Number': 'CertificateNumber',
-                        'Property Location': 'PropertyLocation',
-                        'C of E Description': 'COfEDescription',
-                        'Comments': 'Comments',
-                        'Residence Type': 'ResidenceType',
-                        'Use': 'Use',
-                        'Apartments': 'Apartments',
-                        'Exterior Construction': 'ExteriorConstruction',
-                        'Full Baths': 'FullBaths',
-                        'Half Baths': 'HalfBaths',
-                        'Basement1': 'Basement1',
-                        'Attic': 'Attic',
-                        'Central Air': 'CentralAir',
-                        'Number of Fireplaces': 'NumberOfFireplaces',
-                        'Garage Size/Type2': 'GarageSizeType2'
-                    }
-
-                    # Find all detail row containers
-                    detail_rows = soup.find_all(['div', 'span'], class_=['detail-row', 'detail-row--label', 'col-xs-3 pt-header',
-                                                                        'col-xs-2', 'detail-row--detail', 'large', 'col-xs-4', 'col-xs-5', 'small'])
-                    column_name = None
-                    # Iterate over each detail row and extract label and value
-                    for row in detail_rows:
-                        if 'detail-row--label' in row.get('class', []):
-                            label = row.text.strip()
-                            if label in label_to_column:
-                                column_name = label_to_column[label]
-                                property_data[column_name] = None  # Initialize with None
-                        elif 'detail-row--detail' in row.get('class', []):
-                            value = row.text.strip()
-                            if column_name in property_data:
-                                property_data[column_name] = value
-                            else:
-                                print("Skipping value because column_name is not defined")
-
-                    # Append property data to all_data list
-                    all_data.append(property_data)
-                else:
-                    print(f"Failed to retrieve page for PIN {pin}, status code: {response.status_code}")
-                    print(response.text)  # Print response content for debugging
-
-            except requests.RequestException as e:
-                print(f"Request failed for PIN {pin}: {e}")
-
-        # Convert all_data to pandas DataFrame
-        df = pd.DataFrame(all_data)
-
-        print(f"Number of columns in DataFrame: {len(df.columns)}")
-
-        # Insert data into MySQL database
-        try:
-            # Prepare SQL query for insertion or update
-            insert_query = f"""
-                INSERT INTO property_details (
-                    `Pin`, `Address`, `City`, `Township`, `PropertyClassification`, `SquareFootage`,
-                    `Neighborhood`, `Taxcode`, `NextScheduledReassessment`, `Description`, `Age`,
-                    `BuildingSquareFootage`, `AssessmentPhase`, `PreviousBoardCertified`, `Status`,
-                    `AssessorValuation`, `AssessorPostAppealValuation`, `AppealNumber`,
-                    `AttorneyTaxRepresentative`, `Applicant`, `Result`, `Reason`, `TaxYear`,
-                    `CertificateNumber`, `PropertyLocation`, `COfEDescription`, `Comments`,
-                    `ResidenceType`, `Use`, `Apartments`, `ExteriorConstruction`, `FullBaths`,
-                    `HalfBaths`, `Basement1`, `Attic`, `CentralAir`, `NumberOfFireplaces`,
-                    `GarageSizeType2`
-                ) VALUES (
-                    %(Pin)s, %(Address)s, %(City)s, %(Township)s, %(PropertyClassification)s, %(SquareFootage)s,
-                    %(Neighborhood)s, %(Taxcode)s, %(NextScheduledReassessment)s, %(Description)s, %(Age)s,
-                    %(BuildingSquareFootage)s, %(AssessmentPhase)s, %(PreviousBoardCertified)s, %(Status)s,
-                    %(AssessorValuation)s, %(AssessorPostAppealValuation)s, %(AppealNumber)s,
-                    %(AttorneyTaxRepresentative)s, %(Applicant)s, %(Result)s, %(Reason)s, %(TaxYear)s,
-                    %(CertificateNumber)s, %(PropertyLocation)s, %(COfEDescription)s, %(Comments)s,
-                    %(ResidenceType)s, %(Use)s, %(Apartments)s, %(ExteriorConstruction)s, %(FullBaths)s,
-                    %(HalfBaths)s, %(Basement1)s, %(Attic)s, %(CentralAir)s, %(NumberOfFireplaces)s,
-                    %(GarageSizeType2)s
-                )
-                ON DUPLICATE KEY UPDATE
-                    `Address` = VALUES(`Address`),
-                    `City` = VALUES(`City`),
-                    `Township` = VALUES(`Township`),
-                    `PropertyClassification` = VALUES(`PropertyClassification`),
-                    `SquareFootage` = VALUES(`SquareFootage`),
-                    `Neighborhood` = VALUES(`Neighborhood`),
-                    `Taxcode` = VALUES(`Taxcode`),
-                    `NextScheduledReassessment` = VALUES(`NextScheduledReassessment`),
-                    `Description` = VALUES(`Description`),
-                    `Age` = VALUES(`Age`),
-                    `BuildingSquareFootage` = VALUES(`BuildingSquareFootage`),
-                    `AssessmentPhase` = VALUES(`AssessmentPhase`),
-                    `PreviousBoardCertified` = VALUES(`PreviousBoardCertified`),
-                    `Status` = VALUES(`Status`),
-                    `AssessorValuation` = VALUES(`AssessorValuation`),
-                    `AssessorPostAppealValuation` = VALUES(`AssessorPostAppealValuation`),
-                    `AppealNumber` = VALUES(`AppealNumber`),
-                    `AttorneyTaxRepresentative` = VALUES(`AttorneyTaxRepresentative`),
-                    `Applicant` = VALUES(`Applicant`),
-                    `Result` = VALUES(`Result`),
-                    `Reason` = VALUES(`Reason`),
-                    `TaxYear` = VALUES(`TaxYear`),
-                    `CertificateNumber` = VALUES(`CertificateNumber`),
-                    `PropertyLocation` = VALUES(`PropertyLocation`),
-                    `COfEDescription` = VALUES(`COfEDescription`),
-                    `Comments` = VALUES(`Comments`),
-                    `ResidenceType` = VALUES(`ResidenceType`),
-                    `Use` = VALUES(`Use`),
-                    `Apartments` = VALUES(`Apartments`),
-                    `ExteriorConstruction` = VALUES(`ExteriorConstruction`),
-                    `FullBaths` = VALUES(`FullBaths`),
-                    `HalfBaths` = VALUES(`HalfBaths`),
-                    `Basement1` = VALUES(`Basement1`),
-                    `Attic` = VALUES(`Attic`),
-                    `CentralAir` = VALUES(`CentralAir`),
-                    `NumberOfFireplaces` = VALUES(`NumberOfFireplaces`),
-                    `GarageSizeType2` = VALUES(`GarageSizeType2`)
-            """
-
-            # Iterate over rows in DataFrame and insert/update data
-            for index, row in df.iterrows():
-                # Clean up PIN and other columns as needed
-                if pd.notna(row['Pin']):
-                    if isinstance(row['Pin'], str):
-                        row['Pin'] = int(row['Pin'].replace('-', ''))
-
-                if pd.notna(row['SquareFootage']):
-                    if isinstance(row['SquareFootage'], str):
-                        row['SquareFootage'] = int(row['SquareFootage'].replace(',', ''))
-
-                if pd.notna(row['BuildingSquareFootage']):
-                    if isinstance(row['BuildingSquareFootage'], str):
-                        try:
-                            row['BuildingSquareFootage'] = int(row['BuildingSquareFootage'].replace(',', ''))
-                        except ValueError:
-                            row['BuildingSquareFootage'] = None  # Handle invalid values
-
-                # Clean up monetary values if needed
-                if pd.notna(row['AssessorValuation']):
-                    if isinstance(row['AssessorValuation'], str):
-                        row['AssessorValuation'] = clean_up_monetary_value(row['AssessorValuation'])
-
-                if pd.notna(row['AssessorPostAppealValuation']):
-                    if isinstance(row['AssessorPostAppealValuation'], str):
-                        row['AssessorPostAppealValuation'] = clean_up_monetary_value(row['AssessorPostAppealValuation'])
-
-                if pd.notna(row['PreviousBoardCertified']):
-                    if isinstance(row['PreviousBoardCertified'], str):
-                        row['PreviousBoardCertified'] = clean_up_monetary_value(row['PreviousBoardCertified'])
-
-                # Convert Pandas Series to dictionary
-                row_dict = row.to_dict()
-                row_dict = {key: (None if pd.isna(value) else value) for key, value in row_dict.items()}
-                # Execute insertion or update query with retry logic
-                execute_query_with_retry(connection, insert_query, row_dict)
-
-                print(f"Row inserted/updated successfully: {row_dict}")
-
-            # Commit changes to database
-            connection.commit()
-            print("Data insertion/update completed successfully")
-
-        except Error as e:
-            print(f"Error inserting/updating data into MySQL database: {e}")
+                staging.rollback(connection)
+            except Error as rollback_error:
+                logger.error("Could not roll back the full refresh: %s", rollback_error)
 
     finally:
-        # Close cursor and connection
-        if 'cursor' in locals() and cursor is not None:
-            cursor.close()
+        if own_parse_pool is not None:
+            own_parse_pool.close()
+        # Close the writers' connections, then the caller's
+        if executor is not None:
+            executor.close()
         if 'connection' in locals() and connection is not None:
             connection.close()
-            print("MySQL connection is closed")
+            logger.info("MySQL connection is closed")
+
+# Function to name the validators file of one shard, so workers never overwrite each other's
+def shard_validators_file(validators_file, shard):
+    if not validators_file:
+        return None
+    root, ext = os.path.splitext(validators_file)
+    return f'{root}.{shard:04d}{ext}'
+
+# Function to run one sharded worker: lease shards from scrape_shards and scrape them until none are left.
+# Any number of these can run, in several processes and on several hosts, against the same database.
+def run_shard_worker(db_host=DB_HOST, lease_seconds=DEFAULT_LEASE_SECONDS, cache_dir=DEFAULT_CACHE_DIR,
+                     cache_max_bytes=DEFAULT_MAX_BYTES, validators_file=VALIDATORS_FILE, log_options=None,
+                     **scrape_options):
+    # A worker process needs its own log writer thread
+    if log_options is not None:
+        configure_logging(**log_options)
+    connection_factory = functools.partial(get_db_connection, db_host)
+    connection = connection_factory()
+    if connection is None:
+        logger.error("Database connection is not available")
+        return
+
+    owner = default_owner()
+    page_cache = PageCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+    # One parse pool for every shard: starting spawned processes re-imports the scraper in each of them
+    parse_processes = scrape_options.pop('parse_processes', 0)
+    parse_pool = None
+    if parse_processes:
+        parse_pool = ParsePool(parse_processes, backend=scrape_options.get('parser_backend', DEFAULT_BACKEND),
+                               chunk_size=scrape_options.get('parse_chunk_size', DEFAULT_CHUNK_SIZE))
+    try:
+        ensure_scrape_state_table(connection)
+        ensure_shards(connection)
+        while True:
+            lease = claim_shard(connection, owner, lease_seconds)
+            if lease is None:
+                logger.info("Worker %s: no shards left", owner)
+                return
+            logger.info("Worker %s: leased shard %04d (attempt %d)", owner, lease.key, lease.attempts)
+
+            # scrape_data closes the connection it is given
+            with ShardHeartbeat(connection_factory, lease, owner, lease_seconds) as heartbeat:
+                failed = scrape_data(connection_factory(), connection_factory=connection_factory,
+                                     validators_file=shard_validators_file(validators_file, lease.key),
+                                     page_cache=page_cache, parse_pool=parse_pool, shard=lease.key,
+                                     resume_since=lease.resume_since, stop=heartbeat.lost, **scrape_options)
+
+            if heartbeat.lost.is_set():
+                # Another worker holds the shard now; rows already stored are checkpointed, so it skips them
+                continue
+            if failed == 0:
+                complete_shard(connection, lease, owner)
+            else:
+                release_shard(connection, lease, owner)
+    finally:
+        if parse_pool is not None:
+            parse_pool.close()
+        connection.close()
 
 def main():
-    connection = get_db_connection()
+    parser = argparse.ArgumentParser(description='Scrape Cook County assessor pages into property_details')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='number of assessor requests kept in flight')
+    parser.add_argument('--per-host-limit', type=int, default=DEFAULT_PER_HOST_LIMIT,
+                        help='maximum simultaneous requests to any one host')
+    parser.add_argument('--parse-workers', type=int, default=2,
+                        help='threads parsing fetched pages, when --parse-processes is 0')
+    parser.add_argument('--parse-processes', type=int,
+                        help=f'processes parsing fetched pages; 0 parses in threads '
+                             f'(default: one per core less one, here {default_process_count()})')
+    parser.add_argument('--parse-chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='pages sent to a parse process at a time')
+    parser.add_argument('--clean-workers', type=int, default=1, help='threads cleaning parsed rows')
+    parser.add_argument('--write-workers', type=int, default=1,
+                        help='threads writing to MySQL, each with its own connection')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='items buffered between two stages')
+    parser.add_argument('--batch-size', type=int,
+                        help=f'rows per multi-row upsert and transaction (default {DEFAULT_BATCH_SIZE}, '
+                             f'{STAGING_BATCH_SIZE} with --full-refresh)')
+    parser.add_argument('--parser', choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help='HTML extractor backend for assessor pages')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='directory of compressed raw pages (empty string disables the cache)')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2,
+                        help='size at which the oldest cached pages are evicted')
+    parser.add_argument('--reparse-from-cache', action='store_true',
+                        help='rebuild property_details from cached pages without fetching')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only scrape PINs that are new, missing, stale or due for reassessment')
+    parser.add_argument('--max-age-days', type=int, default=DEFAULT_MAX_AGE_DAYS,
+                        help='with --incremental, rescrape PINs last scraped longer ago than this')
+    parser.add_argument('--due-max-age-days', type=int, default=DEFAULT_DUE_MAX_AGE_DAYS,
+                        help='with --incremental, max age for PINs whose reassessment is due soon')
+    parser.add_argument('--lookahead-years', type=int, default=DEFAULT_LOOKAHEAD_YEARS,
+                        help='with --incremental, reassessment counts as due this many years ahead')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the last interrupted run, skipping PINs it already stored')
+    parser.add_argument('--metrics-file', help='write a JSON snapshot of the run metrics here periodically')
+    parser.add_argument('--metrics-interval', type=float, default=DEFAULT_SNAPSHOT_INTERVAL,
+                        help='seconds between metrics snapshots and progress lines')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve Prometheus text metrics on http://<host>:<port>/metrics')
+    parser.add_argument('--db-host', default=DB_HOST, help='MySQL host, e.g. a local database for testing')
+    parser.add_argument('--sharded', action='store_true',
+                        help='lease area/subarea shards from scrape_shards, so several workers share one crawl')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='with --sharded, worker processes started on this host')
+    parser.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS,
+                        help='with --sharded, a shard whose worker stops heartbeating is re-leased after this')
+    parser.add_argument('--new-crawl', action='store_true',
+                        help='with --sharded, put every shard back to pending before starting')
+    parser.add_argument('--full-refresh', action='store_true',
+                        help='rescrape every PIN into a staging table and swap it in atomically at the end')
+    parser.add_argument('--load-method', choices=LOAD_METHODS, default=DEFAULT_LOAD_METHOD,
+                        help='with --full-refresh, batched INSERTs or one LOAD DATA LOCAL INFILE of a spooled file')
+    parser.add_argument('--spool-dir', default=tempfile.gettempdir(),
+                        help='with --load-method load-data, directory of the spooled rows')
+    parser.add_argument('--snapshot-dir',
+                        help='also write the scraped rows as a partitioned Parquet/Arrow snapshot here '
+                             '(every page is downloaded, so the snapshot holds every PIN)')
+    parser.add_argument('--snapshot-format', choices=FORMATS, default=DEFAULT_FORMAT, help='snapshot file format')
+    parser.add_argument('--snapshot-partition-by', default=DEFAULT_PARTITION_BY,
+                        help='column whose values name the snapshot partition directories')
+    parser.add_argument('--log-level', default=DEFAULT_LEVEL,
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper,
+                        help='minimum level logged; per-PIN lines are DEBUG')
+    parser.add_argument('--log-sample', type=float, default=DEFAULT_SAMPLE_RATE,
+                        help='share of PINs whose per-PIN lines are logged, e.g. 0.01')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='log only end-of-run summaries and errors')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text', help='log line format')
+    parser.add_argument('--log-file', help='write the log here instead of stderr')
+    args = parser.parse_args()
+    if args.full_refresh and (args.incremental or args.resume or args.sharded or args.reparse_from_cache):
+        parser.error('--full-refresh rescrapes everything in one run; it cannot be combined with '
+                     '--incremental, --resume, --sharded or --reparse-from-cache')
+    if args.snapshot_dir and (args.incremental or args.resume or args.sharded or args.reparse_from_cache):
+        parser.error('--snapshot-dir replaces the last snapshot with the rows of one run over every PIN; it '
+                     'cannot be combined with --incremental, --resume, --sharded or --reparse-from-cache')
+    if args.batch_size is None:
+        args.batch_size = STAGING_BATCH_SIZE if args.full_refresh else DEFAULT_BATCH_SIZE
+    if args.parse_processes is None:
+        # Worker processes on one host share its cores
+        args.parse_processes = default_process_count() // (args.processes if args.sharded else 1)
+
+    log_options = dict(level=args.log_level, sample_rate=args.log_sample, summary_only=args.summary_only,
+                       fmt=args.log_format, path=args.log_file)
+    configure_logging(**log_options)
+
+    if args.sharded:
+        if args.new_crawl:
+            connection = get_db_connection(args.db_host)
+            if connection is None:
+                return
+            ensure_shards(connection)
+            reset_shards(connection)
+            connection.close()
+
+        worker_options = dict(
+            db_host=args.db_host, lease_seconds=args.lease_seconds, cache_dir=args.cache_dir,
+            cache_max_bytes=args.cache_max_mb * 1024 ** 2, concurrency=args.concurrency,
+            per_host_limit=args.per_host_limit, parse_workers=args.parse_workers,
+            parse_processes=args.parse_processes, parse_chunk_size=args.parse_chunk_size,
+            clean_workers=args.clean_workers, write_workers=args.write_workers, queue_size=args.queue_size,
+            batch_size=args.batch_size, parser_backend=args.parser, incremental=args.incremental,
+            max_age_days=args.max_age_days, due_max_age_days=args.due_max_age_days,
+            lookahead_years=args.lookahead_years, metrics_interval=args.metrics_interval,
+            log_options=log_options)
+        workers = [multiprocessing.Process(target=run_shard_worker, kwargs=worker_options)
+                   for _ in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return
+
+    page_cache = PageCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 ** 2) if args.cache_dir else None
+
+    metrics = Metrics()
+    if args.metrics_port:
+        serve_metrics(metrics, args.metrics_port)
+
+    # LOAD DATA LOCAL INFILE is only allowed to read the spool directory
+    connection_options = {}
+    if args.full_refresh and args.load_method == 'load-data':
+        connection_options['allow_local_infile_in_path'] = args.spool_dir
+
+    connection = get_db_connection(args.db_host, **connection_options)
     if connection:
-        scrape_data(connection)
+        snapshot = None
+        if args.snapshot_dir:
+            snapshot = SnapshotExport(args.snapshot_dir, partition_by=args.snapshot_partition_by,
+                                      fmt=args.snapshot_format)
+        failed = scrape_data(connection, concurrency=args.concurrency, per_host_limit=args.per_host_limit,
+                             parse_workers=args.parse_workers, parse_processes=args.parse_processes,
+                             parse_chunk_size=args.parse_chunk_size, clean_workers=args.clean_workers,
+                             write_workers=args.write_workers, queue_size=args.queue_size,
+                             batch_size=args.batch_size, parser_backend=args.parser, page_cache=page_cache,
+                             reparse_from_cache=args.reparse_from_cache, incremental=args.incremental,
+                             max_age_days=args.max_age_days, due_max_age_days=args.due_max_age_days,
+                             lookahead_years=args.lookahead_years, resume=args.resume,
+                             connection_factory=functools.partial(get_db_connection, args.db_host,
+                                                                  **connection_options),
+                             metrics=metrics, metrics_file=args.metrics_file,
+                             metrics_interval=args.metrics_interval, snapshot=snapshot,
+                             full_refresh=args.full_refresh, load_method=args.load_method,
+                             spool_dir=args.spool_dir)
+        if snapshot is not None:
+            # Like the validators, the snapshot only replaces the last one after a clean run
+            if failed == 0:
+                snapshot.close()
+            else:
+                snapshot.abort()
+
 if __name__ == "__main__":
     main()
@@ -1,15 +1,37 @@
-from flask import Flask, jsonify, request
-from bs4 import BeautifulSoup
+from flask import Flask, Response, jsonify, request, url_for
+import logging
+import threading
 import time
-import requests
 import mysql.connector
 from mysql.connector import Error
-import pandas as pd
+from cleaning import clean_records
+from fetch_engine import IDLE, fetch_concurrently
+from http_client import NOT_MODIFIED
+from db_executor import DbExecutor
+from property_upsert import upsert_rows
+from metrics import default_metrics
+from rate_limiter import RETRY_LATER
+from result_stream import STREAM_FORMATS, stream_format, stream_results
+from scrape_jobs import JobQueue, JobQueueFull
+from scrape_service import (forget_result, forget_validators, retry_after_seconds, scrape_and_store_cached,
+                            scrape_property_data)
+from property_record import SOURCE_PIN
+from scrape_logging import configure_logging
 from password import cloud_password  # Import your database password here
 
 # Initialize Flask app
 app = Flask(__name__)
 
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_PINS = 500  # PINs accepted by one /scrape-properties request
+BATCH_CONCURRENCY = 8  # Assessor requests in flight per /scrape-properties request
+MAX_STREAM_PINS = 10000  # PINs accepted by one streamed /scrape-properties request
+STREAM_BATCH_SIZE = 50  # Rows per transaction when streaming...
+STREAM_FLUSH_SECONDS = 1.0  # ...or fewer, once the first of them has waited this long
+JOB_WORKERS = 4  # Scrape jobs worked on at once in ?mode=job
+JOBS_FILE = 'scrape_jobs.sqlite3'  # Where queued jobs and their results are kept (None keeps them in memory)
+
 # MySQL database configuration
 db_config = {
     'host': '148.72.118.86',  # Replace with your database host
@@ -26,143 +48,18 @@ db_config = {
 def connect_to_mysql():
     try:
         conn = mysql.connector.connect(**db_config)
-        print("Connected to MySQL database successfully")
+        logger.info("Connected to MySQL database successfully")
         return conn
     except Error as e:
-        print(f"Error: {e}")
-        return None
-
-# Function to clean up monetary values
-def clean_up_monetary_value(value):
-    if pd.isna(value):  # Check if the value is NaN
+        logger.error("Error: %s", e)
         return None
-    else:
-        # Convert to string and remove dollar sign ($) and commas (,)
-        cleaned_value = str(value).replace('$', '').replace(',', '')
-        try:
-            # Convert cleaned value to integer (handles cases like '0.00' and '12,345')
-            cleaned_value = int(cleaned_value)
-        except ValueError:
-            # If value cannot be converted to integer, return None
-            return None
-        return cleaned_value
-
-def clean_up_square_footage(value):
-    if pd.notna(value):
-        # Replace commas and asterisks and then convert to int
-        cleaned_value = value.replace(',', '').replace('*', '')
-        try:
-            return int(cleaned_value)
-        except ValueError:
-            return None  # Or handle the error as per your application's logic
-    return None  # Or handle the case where value is None or not applicable
-
-def clean_property_data(property_data):
-    # Print original property_data for debugging
-    print("Original property_data:", property_data)
-
-    # Clean up 'Pin' field
-    if pd.notna(property_data.get('Pin')):
-        if isinstance(property_data['Pin'], str):
-            # Remove dashes and convert to integer
-            cleaned_pin = property_data['Pin'].replace('-', '')
-            print("Cleaned Pin before conversion:", cleaned_pin)
-            try:
-                property_data['Pin'] = int(cleaned_pin)
-            except ValueError as e:
-                print("Error converting Pin to integer:", e)
-                property_data['Pin'] = None  # Handle error case if needed
-
-    # Print cleaned property_data for debugging
-    print("Cleaned property_data:", property_data)
-
-    return property_data
-
 
-# Function to scrape data for a given PIN number
-def scrape_property_data(pin_number):
-    base_url = 'https://www.cookcountyassessor.com/pin/'
-    url = f'{base_url}{pin_number}#address'
-
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            html_text = response.text
-            soup = BeautifulSoup(html_text, 'html.parser')
-
-            # Mapping of web page labels to database columns
-            label_to_column = {
-                'Pin': 'Pin',
-                'Address': 'Address',
-                'City': 'City',
-                'Township': 'Township',
-                'Property Classification': 'PropertyClassification',
-                'Square Footage (Land)': 'SquareFootage',
-                'Neighborhood': 'Neighborhood',
-                'Taxcode': 'Taxcode',
-                'Next Scheduled Reassessment': 'NextScheduledReassessment',
-                'Description': 'Description',
-                'Age': 'Age',
-                'Building Square Footage': 'BuildingSquareFootage',
-                'Assessment Phase': 'AssessmentPhase',
-                'Previous Board Certified': 'PreviousBoardCertified',
-                'Status': 'Status',
-                'Assessor Valuation': 'AssessorValuation',
-                'Assessor Post-Appeal Valuation': 'AssessorPostAppealValuation',
-                'Appeal Number': 'AppealNumber',
-                'Attorney/Tax Representative': 'AttorneyTaxRepresentative',
-                'Applicant': 'Applicant',
-                'Result': 'Result',
-                'Reason': 'Reason',
-                'Tax Year': 'TaxYear',
-                'Certificate Number': 'CertificateNumber',
-                'Property Location': 'PropertyLocation',
-                'C of E Description': 'COfEDescription',
-                'Comments': 'Comments',
-                'Residence Type': 'ResidenceType',
-                'Use': 'Use',
-                'Apartments': 'Apartments',
-                'Exterior Construction': 'ExteriorConstruction',
-                'Full Baths': 'FullBaths',
-                'Half Baths': 'HalfBaths',
-                'Basement1': 'Basement1',
-                'Attic': 'Attic',
-                'Central Air': 'CentralAir',
-                'Number of Fireplaces': 'NumberOfFireplaces',
-                'Garage Size/Type2': 'GarageSizeType2'
-            }
-
-            # Dictionary to store property details
-            property_data = {'Pin': pin_number}
-
-            # Find all detail row containers
-            detail_rows = soup.find_all(['div', 'span'], class_=['detail-row', 'detail-row--label', 'col-xs-3 pt-header',
-                                                                'col-xs-2', 'detail-row--detail', 'large', 'col-xs-4', 'col-xs-5', 'small'])
-
-            column_name = None
-            # Iterate over each detail row and extract label and value
-            for row in detail_rows:
-                if 'detail-row--label' in row.get('class', []):
-                    label = row.text.strip()
-                    if label in label_to_column:
-                        column_name = label_to_column[label]
-                        property_data[column_name] = None  # Initialize with None
-                elif 'detail-row--detail' in row.get('class', []):
-                    value = row.text.strip()
-                    if column_name in property_data:
-                        property_data[column_name] = value
-                    else:
-                        print("Skipping value because column_name is not defined")
-
-            return property_data
-
-        else:
-            print(f"Failed to retrieve page for PIN {pin_number}, status code: {response.status_code}")
-            return None
-
-    except requests.RequestException as e:
-        print(f"Request failed for PIN {pin_number}: {e}")
-        return None
+# Pooled connections with transient-error retries, shared by every request
+db_executor = DbExecutor(connect_to_mysql)
+default_metrics().add_collector(lambda: {
+    'db_retries_total': db_executor.stats.retries,
+    'db_reconnects_total': db_executor.stats.reconnects,
+})
 
 # API endpoint for scraping and inserting property details
 @app.route('/scrape-property', methods=['POST'])
@@ -172,191 +69,156 @@ def scrape_and_insert_property():
     if not pin_number:
         return jsonify({'error': 'PIN number is required'}), 400
 
-    connection = connect_to_mysql()
-    if not connection:
-        return jsonify({'error': 'Failed to connect to database'}), 500
-
-    try:
-        # Scrape property data
-        property_data = scrape_property_data(pin_number)
-
-        if not property_data:
-            return jsonify({'error': f'Failed to scrape data for PIN {pin_number}'}), 500
-
-        # Insert into MySQL database
+    # Job mode: answer at once and scrape in the background
+    if request.args.get('mode') == 'job':
+        return submit_job([str(pin_number)])
+
+    # Requests for a PIN being scraped share that scrape; a recent success is served from the result cache
+    body, status, headers = scrape_and_store_cached(pin_number, db_executor)
+    return jsonify(body), status, headers
+
+# Function to scrape PINs concurrently and upsert their rows batch_size at a time, one transaction per batch.
+# A partial batch is also written once flush_seconds have passed since its first row, so rows do not wait long.
+# Yields a result per PIN as soon as it is final, in completion order: status 'updated' (once its batch is
+# committed), 'unchanged' or 'error' (with the error, and retry_after when the assessor site asked us to back off).
+def iter_scrape_properties(pin_numbers, concurrency=BATCH_CONCURRENCY, batch_size=None, flush_seconds=None):
+    rows = []
+    first_row_at = None
+
+    # Function to clean and write the buffered rows; yields their results
+    def store(rows):
+        # The same cleaning as the batch scraper: rows with a PIN or square footage that is not a number are rejected
+        rows, rejected = clean_records(rows)
+        for row in rejected:
+            forget_validators(row[SOURCE_PIN])
+            yield {'pin': row[SOURCE_PIN], 'status': 'error',
+                   'error': 'Invalid PIN or square footage on the assessor page'}
+        if not rows:
+            return
+
+        # One transaction for the batch; a row MySQL refuses is isolated and reported on its own
+        start = time.perf_counter()
         try:
-            # Clean up property data (if needed)
-            if pd.notna(property_data['SquareFootage']):
-                property_data['SquareFootage'] = int(property_data['SquareFootage'].replace(',', ''))
-
-            if property_data['BuildingSquareFootage'].replace(',', '').isdigit():
-                property_data['BuildingSquareFootage'] = int(property_data['BuildingSquareFootage'].replace(',', ''))
-            else:
-                property_data['BuildingSquareFootage'] = None  # Or another default value
-
-                assessor_valuation = property_data.get('AssessorValuation')
-            if assessor_valuation is not None and pd.notna(assessor_valuation):
-                property_data['AssessorValuation'] = clean_up_monetary_value(assessor_valuation)
-            else:
-                property_data['AssessorValuation'] = None
-
-            # Handle 'AssessorPostAppealValuation'
-            assessor_post_appeal_valuation = property_data.get('AssessorPostAppealValuation')
-            if assessor_post_appeal_valuation is not None and pd.notna(assessor_post_appeal_valuation):
-                property_data['AssessorPostAppealValuation'] = clean_up_monetary_value(assessor_post_appeal_valuation)
-            else:
-                property_data['AssessorPostAppealValuation'] = None
-
-            # Handle 'PreviousBoardCertified'
-            previous_board_certified = property_data.get('PreviousBoardCertified')
-            if previous_board_certified is not None and pd.notna(previous_board_certified):
-                property_data['PreviousBoardCertified'] = clean_up_monetary_value(previous_board_certified)
-            else:
-                property_data['PreviousBoardCertified'] = None
-
-            # Handle 'BuildingSquareFootage'
-            building_square_footage = property_data.get('BuildingSquareFootage')
-            if building_square_footage is not None and pd.notna(building_square_footage):
-                property_data['BuildingSquareFootage'] = clean_up_square_footage(building_square_footage)
-            else:
-                property_data['BuildingSquareFootage'] = None
-
-            # Prepare SQL query for insertion or update
-            property_data = clean_property_data(property_data)
-
-            insert_query = """
-                INSERT INTO property_details (
-                    `Pin`, `Address`, `City`, `Township`, `PropertyClassification`, `SquareFootage`,
-                    `Neighborhood`, `Taxcode`, `NextScheduledReassessment`, `Description`, `Age`,
-                    `BuildingSquareFootage`, `AssessmentPhase`, `PreviousBoardCertified`, `Status`,
-                    `AssessorValuation`, `AssessorPostAppealValuation`, `AppealNumber`,
-                    `AttorneyTaxRepresentative`, `Applicant`, `Result`, `Reason`, `TaxYear`,
-                    `CertificateNumber`, `PropertyLocation`, `COfEDescription`, `Comments`,
-                    `ResidenceType`, `Use`, `Apartments`, `ExteriorConstruction`, `FullBaths`,
-                    `HalfBaths`, `Basement1`, `Attic`, `CentralAir`, `NumberOfFireplaces`,
-                    `GarageSizeType2`
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s
-                )
-                ON DUPLICATE KEY UPDATE
-                    `Address` = VALUES(`Address`),
-                    `City` = VALUES(`City`),
-                    `Township` = VALUES(`Township`),
-                    `PropertyClassification` = VALUES(`PropertyClassification`),
-                    `SquareFootage` = VALUES(`SquareFootage`),
-                    `Neighborhood` = VALUES(`Neighborhood`),
-                    `Taxcode` = VALUES(`Taxcode`),
-                    `NextScheduledReassessment` = VALUES(`NextScheduledReassessment`),
-                    `Description` = VALUES(`Description`),
-                    `Age` = VALUES(`Age`),
-                    `BuildingSquareFootage` = VALUES(`BuildingSquareFootage`),
-                    `AssessmentPhase` = VALUES(`AssessmentPhase`),
-                    `PreviousBoardCertified` = VALUES(`PreviousBoardCertified`),
-                    `Status` = VALUES(`Status`),
-                    `AssessorValuation` = VALUES(`AssessorValuation`),
-                    `AssessorPostAppealValuation` = VALUES(`AssessorPostAppealValuation`),
-                    `AppealNumber` = VALUES(`AppealNumber`),
-                    `AttorneyTaxRepresentative` = VALUES(`AttorneyTaxRepresentative`),
-                    `Applicant` = VALUES(`Applicant`),
-                    `Result` = VALUES(`Result`),
-                    `Reason` = VALUES(`Reason`),
-                    `TaxYear` = VALUES(`TaxYear`),
-                    `CertificateNumber` = VALUES(`CertificateNumber`),
-                    `PropertyLocation` = VALUES(`PropertyLocation`),
-                    `COfEDescription` = VALUES(`COfEDescription`),
-                    `Comments` = VALUES(`Comments`),
-                    `ResidenceType` = VALUES(`ResidenceType`),
-                    `Use` = VALUES(`Use`),
-                    `Apartments` = VALUES(`Apartments`),
-                    `ExteriorConstruction` = VALUES(`ExteriorConstruction`),
-                    `FullBaths` = VALUES(`FullBaths`),
-                    `HalfBaths` = VALUES(`HalfBaths`),
-                    `Basement1` = VALUES(`Basement1`),
-                    `Attic` = VALUES(`Attic`),
-                    `CentralAir` = VALUES(`CentralAir`),
-                    `NumberOfFireplaces` = VALUES(`NumberOfFireplaces`),
-                    `GarageSizeType2` = VALUES(`GarageSizeType2`)
-            """
-            data = (
-            property_data.get('Pin'),
-            property_data.get('Address'),
-            property_data.get('City'),
-            property_data.get('Township'),
-            property_data.get('PropertyClassification'),
-            property_data.get('SquareFootage'),
-            property_data.get('Neighborhood'),
-            property_data.get('Taxcode'),
-            property_data.get('NextScheduledReassessment'),
-            property_data.get('Description'),
-            property_data.get('Age'),
-            property_data.get('BuildingSquareFootage'),
-            property_data.get('AssessmentPhase'),
-            property_data.get('PreviousBoardCertified'),
-            property_data.get('Status'),
-            property_data.get('AssessorValuation'),
-            property_data.get('AssessorPostAppealValuation'),
-            property_data.get('AppealNumber'),
-            property_data.get('AttorneyTaxRepresentative'),
-            property_data.get('Applicant'),
-            property_data.get('Result'),
-            property_data.get('Reason'),
-            property_data.get('TaxYear'),
-            property_data.get('CertificateNumber'),
-            property_data.get('PropertyLocation'),
-            property_data.get('COfEDescription'),
-            property_data.get('Comments'),
-            property_data.get('ResidenceType'),
-            property_data.get('Use'),
-            property_data.get('Apartments'),
-            property_data.get('ExteriorConstruction'),
-            property_data.get('FullBaths'),
-            property_data.get('HalfBaths'),
-            property_data.get('Basement1'),
-            property_data.get('Attic'),
-            property_data.get('CentralAir'),
-            property_data.get('NumberOfFireplaces'),
-            property_data.get('GarageSizeType2')
-        )
-            # Execute insertion or update query with retry logic
-            
-            execute_query_with_retry(connection, insert_query, data)
-
-            return jsonify({'message': f'Property details for PIN {pin_number} inserted/updated successfully'}), 201
-
+            failed = upsert_rows(db_executor, rows, batch_size=len(rows))
         except Error as e:
-            return jsonify({'error': f'Error inserting/updating data into MySQL database: {e}'}), 500
-
-    finally:
-        # Close MySQL connection
-        if connection:
-            connection.close()
-            print("MySQL connection is closed")
-
-# Function to execute query with retry logic
-def execute_query_with_retry(connection, query, params):
-    retry_attempts = 3  # Number of retry attempts
-    retry_delay = 5  # Delay in seconds between retries
-
-    for attempt in range(retry_attempts):
-        try:
-            cursor = connection.cursor()
-            cursor.execute(query, params)
-            print("Query executed successfully")
-            return True  # Return True on success
-
-        except mysql.connector.Error as e:
-            print(f"Attempt {attempt+1}: Error executing query: {e}")
-            if attempt < retry_attempts - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                connection.reconnect()  # Reconnect to MySQL server
+            failed = rows
+            logger.error("Error inserting/updating %d rows: %s", len(rows), e)
+        default_metrics().observe('write', time.perf_counter() - start)
+        default_metrics().inc('rows_written_total', len(rows) - len(failed))
+
+        failed_pins = {row[SOURCE_PIN] for row in failed}
+        for row in rows:
+            # A cached /scrape-property response no longer describes what is in MySQL
+            forget_result(row[SOURCE_PIN])
+            if row[SOURCE_PIN] in failed_pins:
+                forget_validators(row[SOURCE_PIN])
+                yield {'pin': row[SOURCE_PIN], 'status': 'error',
+                       'error': 'Error inserting/updating data into MySQL database'}
             else:
-                print("Query execution failed after multiple attempts")
-                return False  # Return False on failure
+                yield {'pin': row[SOURCE_PIN], 'status': 'updated'}
+
+    # Requests share the service's client, so the rate limiter and circuit breaker still apply.
+    # The fetches are polled a tenth of flush_seconds at a time, so a partial batch is flushed on time
+    # even while the assessor site is slow or throttling us.
+    poll_seconds = flush_seconds / 10 if flush_seconds is not None else None
+    for pin, property_data in fetch_concurrently(pin_numbers, scrape_property_data, concurrency, poll_seconds):
+        if property_data is IDLE:
+            pass
+        elif property_data is NOT_MODIFIED:
+            yield {'pin': pin, 'status': 'unchanged'}
+        elif property_data is RETRY_LATER:
+            yield {'pin': pin, 'status': 'error', 'error': 'Assessor site unavailable',
+                   'retry_after': retry_after_seconds()}
+        elif not property_data:
+            forget_validators(pin)
+            yield {'pin': pin, 'status': 'error', 'error': 'Failed to scrape data'}
+        else:
+            property_data[SOURCE_PIN] = pin
+            rows.append(property_data)
+            first_row_at = first_row_at or time.monotonic()
+
+        if rows and ((batch_size and len(rows) >= batch_size) or
+                     (flush_seconds is not None and time.monotonic() - first_row_at >= flush_seconds)):
+            yield from store(rows)
+            rows = []
+            first_row_at = None
+
+    if rows:
+        yield from store(rows)
+
+# Function to scrape a list of PINs concurrently and upsert them all in one batched transaction.
+# Returns a result per PIN, in the order given.
+def scrape_properties(pin_numbers, concurrency=BATCH_CONCURRENCY):
+    results = {result['pin']: result for result in iter_scrape_properties(pin_numbers, concurrency)}
+    return [results[pin] for pin in pin_numbers]
+
+# API endpoint for scraping and inserting many PINs in one request.
+# With ?stream=ndjson or ?stream=sse (or an Accept header asking for either) the response is streamed:
+# a result event per PIN as soon as it is stored, and progress events every few seconds.
+@app.route('/scrape-properties', methods=['POST'])
+def scrape_and_insert_properties():
+    pin_numbers = (request.get_json(silent=True) or {}).get('pin_numbers')
+
+    if not isinstance(pin_numbers, list) or not pin_numbers:
+        return jsonify({'error': 'A list of PIN numbers is required'}), 400
+    if not all(isinstance(pin, (str, int)) and str(pin).isdigit() for pin in pin_numbers):
+        return jsonify({'error': 'PIN numbers must be digits'}), 400
+
+    fmt = stream_format(request.args.get('stream'), request.headers.get('Accept'))
+    if request.args.get('stream') and fmt is None:
+        return jsonify({'error': f"stream must be one of {', '.join(STREAM_FORMATS)}"}), 400
+
+    # A PIN asked for twice is scraped once
+    pin_numbers = list(dict.fromkeys(str(pin) for pin in pin_numbers))
+    job = request.args.get('mode') == 'job'
+    max_pins = MAX_STREAM_PINS if fmt and not job else MAX_BATCH_PINS
+    if len(pin_numbers) > max_pins:
+        return jsonify({'error': f'At most {max_pins} PIN numbers per request'}), 400
+
+    if job:
+        return submit_job(pin_numbers)
+
+    if fmt:
+        # Once the client disconnects no further PINs are started; those in flight are still stored
+        stop = threading.Event()
+        pins = (pin for pin in pin_numbers if not stop.is_set())
+        results = iter_scrape_properties(pins, batch_size=STREAM_BATCH_SIZE, flush_seconds=STREAM_FLUSH_SECONDS)
+        return Response(stream_results(results, len(pin_numbers), fmt, stop), mimetype=STREAM_FORMATS[fmt],
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    results = scrape_properties(pin_numbers)
+    counts = {status: sum(result['status'] == status for result in results)
+              for status in ('updated', 'unchanged', 'error')}
+    return jsonify({'results': results, **counts}), 200
+
+# Background workers for ?mode=job; a job is a list of PINs scraped like a /scrape-properties request
+job_queue = JobQueue(scrape_properties, workers=JOB_WORKERS, path=JOBS_FILE, metrics=default_metrics())
+# Workers start with the app, so jobs left queued or running by a process that is gone are recovered at once
+job_queue.start()
+
+# Function to queue a scrape job and answer 202 with where to poll for its status
+def submit_job(pin_numbers):
+    try:
+        job_id = job_queue.submit(pin_numbers)
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '60'}
+    status_url = url_for('get_job', job_id=job_id)
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url}), 202, {'Location': status_url}
+
+# API endpoint with the status of a scrape job, and its per-PIN results once it is done
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'No job {job_id}'}), 404
+    return jsonify(job), 200
+
+# API endpoint with the service's fetch/parse/write timings and counters in Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return default_metrics().prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
 # Run the Flask app
 if __name__ == '__main__':
+    configure_logging()
     app.run(debug=True)
@@ -0,0 +1,158 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import errorcode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4  # Connections kept open per executor
+MAX_ATTEMPTS = 5  # Attempts per unit of work when the error is transient
+BASE_DELAY = 0.05  # Seconds; the backoff ceiling doubles on every attempt...
+MAX_DELAY = 2.0  # ...up to this
+
+# Errors that go away by themselves: a dropped or refused connection, lock contention, a busy server
+TRANSIENT_ERRNOS = {
+    errorcode.CR_CONNECTION_ERROR,
+    errorcode.CR_CONN_HOST_ERROR,
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_SERVER_LOST_EXTENDED,
+    errorcode.ER_CON_COUNT_ERROR,
+    errorcode.ER_LOCK_DEADLOCK,
+    errorcode.ER_LOCK_WAIT_TIMEOUT,
+    errorcode.ER_QUERY_INTERRUPTED,
+    errorcode.ER_SERVER_SHUTDOWN,
+}
+
+
+# Function to tell a transient error (worth retrying) from a permanent one (bad SQL, bad data)
+def is_transient(error):
+    if error.errno in TRANSIENT_ERRNOS:
+        return True
+    # Connector-side failures (no errno) such as a broken socket
+    return error.errno is None and isinstance(error, (mysql.connector.InterfaceError,
+                                                      mysql.connector.OperationalError))
+
+
+# Function to pick the wait before retry number attempt: exponential backoff with full jitter
+def backoff_delay(attempt, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+# Counters for what the executor ran and how often the link misbehaved
+class DbStats:
+    def __init__(self):
+        self.queries = 0
+        self.retries = 0
+        self.reconnects = 0
+        self.transient_errors = 0
+        self.permanent_errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def summary(self):
+        return (f"DB: {self.queries} queries, {self.retries} retries, {self.reconnects} reconnects, "
+                f"{self.transient_errors} transient and {self.permanent_errors} permanent errors")
+
+
+# Pool of MySQL connections that runs work with retries: transient errors are retried on a
+# repaired connection after a short jittered backoff, permanent errors are raised straight away
+class DbExecutor:
+    def __init__(self, connection_factory, pool_size=DEFAULT_POOL_SIZE, max_attempts=MAX_ATTEMPTS,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY, connections=()):
+        self.connection_factory = connection_factory
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = DbStats()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        # Already open connections (e.g. the caller's) are used before new ones are opened
+        for connection in connections:
+            self._idle.put(connection)
+
+    # Function to take an idle connection, or open a new one
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            connection = self.connection_factory()
+            if connection is None:
+                raise mysql.connector.InterfaceError("Could not connect to MySQL")
+            return connection
+
+    # Function to repair a connection after a transient error; returns False if it could not be
+    def _reconnect(self, connection):
+        self.stats.add(reconnects=1)
+        try:
+            connection.reconnect(attempts=1, delay=0)
+            return True
+        except mysql.connector.Error as e:
+            logger.warning("Reconnect failed: %s", e)
+            return False
+
+    # Function to run work(connection) on a pooled connection with retries; returns what work returns.
+    # work must be safe to repeat: it is run again from the start after a transient error.
+    def run(self, work):
+        for attempt in range(self.max_attempts):
+            with self._slots:
+                connection = None
+                try:
+                    connection = self._checkout()
+                    return work(connection)
+                except mysql.connector.Error as e:
+                    if not is_transient(e):
+                        self.stats.add(permanent_errors=1)
+                        raise
+                    self.stats.add(transient_errors=1)
+                    logger.warning("Attempt %d: transient MySQL error: %s", attempt + 1, e)
+                    # A connection that cannot be repaired is dropped; the next attempt opens a new one
+                    if connection is not None and not self._reconnect(connection):
+                        connection = None
+                    if attempt == self.max_attempts - 1:
+                        raise
+                finally:
+                    if connection is not None:
+                        self._idle.put(connection)
+            self.stats.add(retries=1)
+            time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+
+    # Function to run one statement (or executemany over a list of params) on a pooled connection.
+    # Returns the fetched rows when fetch is set, otherwise the affected row count.
+    def execute(self, query, params=None, many=False, fetch=False):
+        def work(connection):
+            cursor = connection.cursor()
+            try:
+                if many:
+                    cursor.executemany(query, params)
+                else:
+                    cursor.execute(query, params)
+                result = cursor.fetchall() if fetch else cursor.rowcount
+                if not connection.autocommit:
+                    connection.commit()
+                self.stats.add(queries=1)
+                return result
+            finally:
+                cursor.close()
+
+        return self.run(work)
+
+    # Function to close every idle connection
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                connection.close()
+            except mysql.connector.Error:
+                pass
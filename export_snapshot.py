@@ -0,0 +1,203 @@
+import argparse
+import logging
+import os
+import shutil
+import threading
+import time
+from urllib.parse import quote
+
+from property_record import COLUMN_NAMES
+from scrape_logging import SUMMARY, configure_logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only snapshot exports need it
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('parquet', 'arrow')
+DEFAULT_FORMAT = 'parquet'
+DEFAULT_PARTITION_BY = 'Township'
+DEFAULT_ROW_GROUP_SIZE = 50000  # Rows buffered per partition before they are written out
+EXPORT_PAGE_SIZE = 10000  # Rows read from property_details per query
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'  # Directory of rows whose partition column is NULL
+
+# Columns the cleaning stage turns into whole numbers; typed int64 in the snapshot, the rest are text
+INTEGER_COLUMNS = ('Pin', 'SquareFootage', 'BuildingSquareFootage', 'PreviousBoardCertified',
+                   'AssessorValuation', 'AssessorPostAppealValuation')
+
+# One page of property_details, keyset-paginated on the primary key
+EXPORT_QUERY = f"""
+    SELECT {', '.join(f'`{name}`' for name in COLUMN_NAMES)}
+    FROM property_details
+    WHERE Pin > %s
+    ORDER BY Pin
+    LIMIT %s
+"""
+
+
+def _integer(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+# Writes property_details rows as a Hive-partitioned columnar snapshot:
+# <path>/<partition_by>=<value>/part-0.parquet (or .arrow), readable with e.g.
+# pyarrow.dataset.dataset(path, partitioning='hive') or pandas.read_parquet(path).
+# Files are written under <path>.tmp-<pid> and moved into place by close(), so readers never
+# see half a snapshot; abort() throws the partial one away. Safe to add() to from several threads.
+class SnapshotExport:
+    def __init__(self, path, partition_by=DEFAULT_PARTITION_BY, fmt=DEFAULT_FORMAT,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        if pa is None:
+            raise RuntimeError("Snapshot export needs pyarrow (pip install pyarrow)")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown snapshot format {fmt!r}, expected one of {', '.join(FORMATS)}")
+        if partition_by not in COLUMN_NAMES:
+            raise ValueError(f"Unknown partition column {partition_by!r}")
+
+        self.path = path
+        self.partition_by = partition_by
+        self.fmt = fmt
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._partition_index = COLUMN_NAMES.index(partition_by)
+        # The partition column lives in the directory names, not in the files
+        self._columns = [(index, name) for index, name in enumerate(COLUMN_NAMES) if name != partition_by]
+        self.schema = pa.schema([(name, pa.int64() if name in INTEGER_COLUMNS else pa.string())
+                                 for _, name in self._columns])
+        self._tmp_path = f'{path}.tmp-{os.getpid()}'
+        self._buffers = {}
+        self._writers = {}
+        self._lock = threading.Lock()
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+        os.makedirs(self._tmp_path)
+
+    # Function to add rows: tuples of the property_details columns in table order (PropertyDetail.as_params)
+    def add(self, rows):
+        with self._lock:
+            for row in rows:
+                value = row[self._partition_index]
+                partition = NULL_PARTITION if value is None or value == '' else str(value)
+                buffer = self._buffers.setdefault(partition, [])
+                buffer.append(row)
+                if len(buffer) >= self.row_group_size:
+                    self._flush(partition)
+
+    # Function to write one partition's buffered rows as a row group (or record batch)
+    def _flush(self, partition):
+        rows = self._buffers.pop(partition, None)
+        if not rows:
+            return
+        arrays = []
+        for index, name in self._columns:
+            if name in INTEGER_COLUMNS:
+                arrays.append(pa.array([_integer(row[index]) for row in rows], pa.int64()))
+            else:
+                arrays.append(pa.array([_text(row[index]) for row in rows], pa.string()))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+
+        writer = self._writers.get(partition)
+        if writer is None:
+            directory = os.path.join(self._tmp_path, f'{self.partition_by}={quote(partition, safe="")}')
+            os.makedirs(directory, exist_ok=True)
+            file_path = os.path.join(directory, f'part-0.{self.fmt}')
+            if self.fmt == 'parquet':
+                writer = pq.ParquetWriter(file_path, self.schema, compression='zstd')
+            else:
+                writer = pa.ipc.new_file(file_path, self.schema)
+            self._writers[partition] = writer
+        writer.write_table(table)
+        self.rows += len(rows)
+
+    def _close_writers(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    # Function to write what is buffered and move the finished snapshot to path, replacing the old one
+    def close(self):
+        with self._lock:
+            for partition in list(self._buffers):
+                self._flush(partition)
+            self._close_writers()
+
+        old_path = f'{self.path}.old-{os.getpid()}'
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(self._tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logger.info("Snapshot of %d rows in %d partitions written to %s", self.rows,
+                    len(os.listdir(self.path)), self.path, extra=SUMMARY)
+
+    # Function to throw away a snapshot that should not replace the last good one
+    def abort(self):
+        with self._lock:
+            self._buffers = {}
+            self._close_writers()
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+        logger.warning("Snapshot export to %s abandoned", self.path, extra=SUMMARY)
+
+
+# Function to export the whole property_details table as a snapshot, page_size rows per query.
+# Each query is a short primary-key range scan, so the export does not hold up the scraper's writes.
+def export_table(connection, path, partition_by=DEFAULT_PARTITION_BY, fmt=DEFAULT_FORMAT,
+                 page_size=EXPORT_PAGE_SIZE):
+    snapshot = SnapshotExport(path, partition_by=partition_by, fmt=fmt)
+    try:
+        start = time.perf_counter()
+        after_pin = -1
+        while True:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(EXPORT_QUERY, (after_pin, page_size))
+                page = cursor.fetchall()
+            finally:
+                cursor.close()
+            snapshot.add(page)
+            if len(page) < page_size:
+                break
+            after_pin = page[-1][0]
+    except BaseException:
+        snapshot.abort()
+        raise
+    snapshot.close()
+    logger.info("Exported property_details in %.1fs", time.perf_counter() - start, extra=SUMMARY)
+    return snapshot.rows
+
+
+def main():
+    from data_scrape import DB_HOST, get_db_connection
+
+    parser = argparse.ArgumentParser(description='Export property_details as a partitioned Parquet/Arrow snapshot')
+    parser.add_argument('path', help='snapshot directory; replaced when the export finishes')
+    parser.add_argument('--partition-by', default=DEFAULT_PARTITION_BY, choices=COLUMN_NAMES,
+                        help='column whose values name the partition directories')
+    parser.add_argument('--format', choices=FORMATS, default=DEFAULT_FORMAT, help='file format')
+    parser.add_argument('--page-size', type=int, default=EXPORT_PAGE_SIZE, help='rows read per query')
+    parser.add_argument('--db-host', default=DB_HOST, help='MySQL host, e.g. a read replica')
+    args = parser.parse_args()
+
+    configure_logging()
+    connection = get_db_connection(args.db_host)
+    if connection is None:
+        return
+    try:
+        export_table(connection, args.path, partition_by=args.partition_by, fmt=args.format,
+                     page_size=args.page_size)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
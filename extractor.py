@@ -0,0 +1,159 @@
+import logging
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+from property_record import LABEL_TO_COLUMN, PropertyDetail
+from scrape_logging import pin_extra
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional; the other backends need only the standard library and bs4
+    lxml = None
+
+BACKENDS = ('stream', 'lxml', 'html.parser')
+# lxml is the fastest when installed; the single-pass stream parser needs only the standard library
+DEFAULT_BACKEND = 'lxml' if lxml is not None else 'stream'
+
+LABEL_CLASS = 'detail-row--label'
+DETAIL_CLASS = 'detail-row--detail'
+
+# Classes the BeautifulSoup search matched on
+DETAIL_ROW_CLASSES = ['detail-row', 'detail-row--label', 'col-xs-3 pt-header', 'col-xs-2', 'detail-row--detail',
+                      'large', 'col-xs-4', 'col-xs-5', 'small']
+
+# Elements that never have content or an end tag
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source',
+                 'track', 'wbr'}
+# Elements whose text does not count towards the text of the element around them
+HIDDEN_TEXT_ELEMENTS = {'script', 'style', 'template'}
+
+
+# Function to classify a div/span by its class attribute as a 'label', a 'detail' or neither
+def _row_kind(classes):
+    if LABEL_CLASS in classes:
+        return 'label'
+    if DETAIL_CLASS in classes:
+        return 'detail'
+    return None
+
+
+# Full BeautifulSoup tree, as the scrapers always did
+def _rows_html_parser(html_text):
+    soup = BeautifulSoup(html_text, 'html.parser')
+    rows = []
+    for row in soup.find_all(['div', 'span'], class_=DETAIL_ROW_CLASSES):
+        kind = _row_kind(row.get('class', []))
+        if kind:
+            rows.append((kind, row.text.strip()))
+    return rows
+
+
+# lxml's C parser, walking only div and span elements
+def _rows_lxml(html_text):
+    if lxml is None:
+        raise RuntimeError("The 'lxml' extractor backend needs the lxml package")
+    root = lxml.html.fromstring(html_text)
+    # Script and style text is not part of an element's text; drop_tree keeps the text after them
+    for hidden in list(root.iter(*HIDDEN_TEXT_ELEMENTS)):
+        hidden.drop_tree()
+    rows = []
+    for element in root.iter('div', 'span'):
+        kind = _row_kind((element.get('class') or '').split())
+        if kind:
+            rows.append((kind, element.text_content().strip()))
+    return rows
+
+
+# Single pass over the tag stream that only keeps text for detail-row elements
+class _DetailRowParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []  # [kind, text parts] in document order
+        self.stack = []  # (tag, row or None) for every open element
+        self.collecting = []  # Rows whose element is still open
+        self.hidden = 0  # Open script/style elements
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        row = None
+        if tag in ('div', 'span'):
+            for name, value in attrs:
+                if name == 'class' and value:
+                    kind = _row_kind(value.split())
+                    if kind:
+                        row = [kind, []]
+                        self.rows.append(row)
+                        self.collecting.append(row)
+                    break
+        if tag in HIDDEN_TEXT_ELEMENTS:
+            self.hidden += 1
+        self.stack.append((tag, row))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    # An end tag closes the most recent open element of that name and everything inside it
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                for open_tag, row in self.stack[index:]:
+                    if row is not None:
+                        self.collecting.remove(row)
+                    if open_tag in HIDDEN_TEXT_ELEMENTS:
+                        self.hidden -= 1
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        if self.hidden:
+            return
+        for row in self.collecting:
+            row[1].append(data)
+
+
+def _rows_stream(html_text):
+    parser = _DetailRowParser()
+    parser.feed(html_text)
+    parser.close()
+    return [(kind, ''.join(parts).strip()) for kind, parts in parser.rows]
+
+
+_ROW_EXTRACTORS = {
+    'stream': _rows_stream,
+    'lxml': _rows_lxml,
+    'html.parser': _rows_html_parser,
+}
+
+
+# Function to list the (kind, text) of every detail-row label and detail in document order
+def extract_detail_rows(html_text, backend=DEFAULT_BACKEND):
+    try:
+        extract = _ROW_EXTRACTORS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown extractor backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return extract(html_text)
+
+
+# Function to extract property details from an assessor page into a PropertyDetail.
+# Each label found in LABEL_TO_COLUMN starts a column; the detail after it is its value.
+def parse_property_page(html_text, pin, backend=DEFAULT_BACKEND):
+    property_data = PropertyDetail(Pin=pin)
+
+    column_name = None
+    for kind, text in extract_detail_rows(html_text, backend):
+        if kind == 'label':
+            if text in LABEL_TO_COLUMN:
+                column_name = LABEL_TO_COLUMN[text]
+                property_data[column_name] = None  # Initialize with None
+        elif column_name is not None:
+            property_data[column_name] = text
+        else:
+            logger.debug("Skipping value because column_name is not defined", extra=pin_extra(pin))
+
+    return property_data
@@ -0,0 +1,64 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8  # Number of requests kept in flight at once
+DEFAULT_PER_HOST_LIMIT = 6  # Cap on simultaneous requests to any single host
+
+IDLE = object()  # Result yielded (with item None) when poll_seconds pass without a fetch completing
+
+
+# Per-host concurrency cap shared by every fetch worker
+class HostLimiter:
+    def __init__(self, per_host_limit=DEFAULT_PER_HOST_LIMIT):
+        self.per_host_limit = per_host_limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    # Function to get the semaphore guarding requests to the host of a URL
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_limit)
+                self._semaphores[host] = semaphore
+        return semaphore
+
+
+# Function to run fetch_one over items with a bounded number of requests in flight.
+# Yields (item, result) pairs in completion order; a failed item yields None.
+# With poll_seconds, (None, IDLE) is also yielded whenever that long passes with no fetch completing,
+# so the caller can act on a timer (e.g. flush a partial batch) while requests are slow.
+def fetch_concurrently(items, fetch_one, concurrency=DEFAULT_CONCURRENCY, poll_seconds=None):
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = {}
+
+        # Keep the window full without queueing the whole worklist up front
+        def submit_next():
+            for item in items:
+                in_flight[executor.submit(fetch_one, item)] = item
+                return True
+            return False
+
+        for _ in range(concurrency):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            if not done:
+                yield None, IDLE
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning("Fetch failed for %s: %s", item, e)
+                    result = None
+                yield item, result
+                submit_next()
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import default_metrics
+from rate_limiter import AdaptiveRateLimiter, CircuitBreaker, parse_retry_after, retryable_status
+
+DEFAULT_POOL_SIZE = 8  # Keep-alive connections kept open per host
+VALIDATORS_FILE = 'assessor_validators.json'  # Where ETag/Last-Modified values are kept between runs
+
+# Returned instead of a response when the server answers 304 Not Modified
+NOT_MODIFIED = object()
+
+
+# ETag / Last-Modified validators per PIN, optionally persisted to a JSON file
+class ValidatorStore:
+    def __init__(self, path=None):
+        self.path = path
+        self._validators = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self._validators = json.load(f)
+
+    def get(self, key):
+        with self._lock:
+            return self._validators.get(key)
+
+    def forget(self, key):
+        with self._lock:
+            self._validators.pop(key, None)
+
+    def put(self, key, etag, last_modified, size):
+        with self._lock:
+            self._validators[key] = {'etag': etag, 'last_modified': last_modified, 'size': size}
+
+    # Function to write the validators to disk; call only once the scraped rows are stored
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._validators, f)
+            os.replace(tmp_path, self.path)
+
+
+# Counters for what a run downloaded and what keep-alive and 304s saved
+class TransferStats:
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, downloaded=0, saved=0, not_modified=False):
+        with self._lock:
+            self.requests += 1
+            self.bytes_downloaded += downloaded
+            self.bytes_saved += saved
+            if not_modified:
+                self.not_modified += 1
+
+
+# Shared HTTP client with pooled keep-alive connections and conditional GETs.
+# With a rate limiter every request waits for a token, and with a circuit breaker requests fail fast
+# while the site keeps failing (CircuitOpenError) or has asked us to pause (ThrottledError), so a
+# request handler can answer 503 at once. With wait, requests wait out an open circuit and a pause
+# instead (the batch scraper, which has nobody to answer).
+# With metrics, request durations and status codes are recorded.
+class HttpClient:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, validators=None, timeout=60, rate_limiter=None, breaker=None,
+                 metrics=None, wait=False):
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.validators = validators if validators is not None else ValidatorStore()
+        self.timeout = timeout
+        self.stats = TransferStats()
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+        self.metrics = metrics
+        self.wait = wait
+
+    # Function to GET a URL, sending the validators stored for key.
+    # Returns NOT_MODIFIED on a 304, otherwise the response.
+    def get(self, url, key=None):
+        headers = {}
+        cached = self.validators.get(key) if key is not None else None
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        if self.breaker is not None and self.wait:
+            self.breaker.wait_for_request()
+        elif self.breaker is not None:
+            self.breaker.before_request()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(block=self.wait)
+
+        start = time.monotonic()
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            if self.metrics is not None:
+                self.metrics.inc('http_responses_total', status='error')
+            raise
+
+        if self.metrics is not None:
+            self.metrics.observe('fetch', time.monotonic() - start)
+            self.metrics.inc('http_responses_total', status=response.status_code)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.observe(response.status_code, time.monotonic() - start,
+                                      parse_retry_after(response.headers.get('Retry-After')))
+        if self.breaker is not None:
+            if retryable_status(response.status_code):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+        if response.status_code == 304 and cached:
+            self.stats.record(saved=cached.get('size') or 0, not_modified=True)
+            return NOT_MODIFIED
+
+        size = len(response.content)
+        self.stats.record(downloaded=size)
+        if key is not None and response.status_code == 200:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.validators.put(key, etag, last_modified, size)
+        return response
+
+    # Function to count the TCP (and TLS) connections opened so far
+    def connections_opened(self):
+        pools = self.adapter.poolmanager.pools
+        return sum(getattr(pools[key], 'num_connections', 0) for key in list(pools.keys()))
+
+    def summary(self):
+        stats = self.stats
+        connections = self.connections_opened()
+        return (f"HTTP: {stats.requests} requests, {stats.not_modified} not modified (304), "
+                f"{stats.bytes_downloaded} bytes downloaded, {stats.bytes_saved} bytes saved by 304s, "
+                f"{connections} connections opened, {max(stats.requests - connections, 0)} handshakes saved by keep-alive"
+                + (f", {self.rate_limiter.throttled} throttled (429/503), final rate {self.rate_limiter.rate:.1f}/s"
+                   if self.rate_limiter is not None else "")
+                + (f", circuit opened {self.breaker.opened} times" if self.breaker is not None else ""))
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+# Function to get the process-wide client used by the Flask scrape services
+def default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient(rate_limiter=AdaptiveRateLimiter(), breaker=CircuitBreaker(),
+                                         metrics=default_metrics())
+        return _default_client
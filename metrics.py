@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scrape_logging import SUMMARY
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'scrape'  # Prefix of every exported metric name
+# Upper bounds (seconds) of the stage duration histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+DEFAULT_SNAPSHOT_INTERVAL = 10  # Seconds between JSON snapshots / progress lines
+
+
+# Cumulative-bucket histogram of durations, as Prometheus expects
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+
+    # Function to estimate a quantile as the upper bound of the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return self.buckets[-1]
+
+
+def _labels(labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}' if labels else ''
+
+
+# Counters, per-stage duration histograms and progress of a scrape, shared by every thread
+class Metrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.total = None  # PINs in the worklist, when known
+        self._stages = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    # Function to record how long one item (or batch) took in a stage
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    # Function to add to a counter, e.g. inc('http_responses_total', status=200)
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    # Function to export counters kept elsewhere (e.g. DbStats): collector() returns {name: value}
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def set_total(self, total):
+        self.total = total
+
+    # Function to work out throughput and the time left from PINs done and rows written
+    def progress(self):
+        elapsed = time.monotonic() - self.started
+        done = self.counter('pins_done_total')
+        rows = self.counter('rows_written_total')
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if self.total is not None and rate > 0 else None
+        return {
+            'elapsed_seconds': round(elapsed, 1),
+            'pins_total': self.total,
+            'pins_done': done,
+            'pins_per_second': round(rate, 2),
+            'rows_written': rows,
+            'rows_per_second': round(rows / elapsed, 2) if elapsed > 0 else 0.0,
+            'eta_seconds': round(max(eta, 0.0), 1) if eta is not None else None,
+        }
+
+    def _collected(self):
+        values = {}
+        for collector in list(self._collectors):
+            values.update(collector())
+        return values
+
+    # Function to build a JSON-friendly snapshot of everything
+    def snapshot(self):
+        with self._lock:
+            stages = {
+                name: {
+                    'count': histogram.count,
+                    'seconds_total': round(histogram.sum, 3),
+                    'mean_seconds': round(histogram.sum / histogram.count, 4) if histogram.count else None,
+                    'p50_seconds': histogram.quantile(0.5),
+                    'p95_seconds': histogram.quantile(0.95),
+                }
+                for name, histogram in self._stages.items()
+            }
+            counters = {f'{name}{_labels(labels)}': value for (name, labels), value in sorted(self._counters.items())}
+        counters.update(self._collected())
+        return {'progress': self.progress(), 'stages': stages, 'counters': counters}
+
+    # Function to render every metric in the Prometheus text exposition format
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            stages = {name: (list(h.counts), h.count, h.sum) for name, h in self._stages.items()}
+            counters = sorted(self._counters.items())
+
+        if stages:
+            lines.append(f'# TYPE {PREFIX}_stage_seconds histogram')
+        for name, (counts, count, total) in sorted(stages.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{name}"}} {total}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{name}"}} {count}')
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f'# TYPE {PREFIX}_{name} counter')
+                typed.add(name)
+            lines.append(f'{PREFIX}_{name}{_labels(labels)} {value}')
+        for name, value in sorted(self._collected().items()):
+            lines.append(f'# TYPE {PREFIX}_{name} counter')
+            lines.append(f'{PREFIX}_{name} {value}')
+
+        for name, value in self.progress().items():
+            # pins_done and rows_written are already exported as counters
+            if value is not None and name not in ('pins_done', 'rows_written'):
+                lines.append(f'# TYPE {PREFIX}_{name} gauge')
+                lines.append(f'{PREFIX}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Writes a JSON snapshot to path and prints a progress line every interval seconds until stopped
+class SnapshotReporter:
+    def __init__(self, metrics, path=None, interval=DEFAULT_SNAPSHOT_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+
+    def report(self, final=False):
+        snapshot = self.metrics.snapshot()
+        progress = snapshot['progress']
+        eta = f", ETA {progress['eta_seconds']:.0f}s" if progress['eta_seconds'] is not None else ""
+        slowest = max(snapshot['stages'].items(), key=lambda item: item[1]['seconds_total'], default=None)
+        logger.info("Progress: %s/%s PINs, %s rows/s%s%s", progress['pins_done'], progress['pins_total'] or '?',
+                    progress['rows_per_second'], eta, f", busiest stage: {slowest[0]}" if slowest else "",
+                    extra=SUMMARY if final else None)
+        if self.path:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.report(final=True)
+
+
+# Function to serve /metrics in Prometheus text format from a background thread; returns the server
+def serve_metrics(metrics, port, host='0.0.0.0'):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+# Function to get the process-wide metrics used by the Flask scrape services
+def default_metrics():
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
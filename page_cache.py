@@ -0,0 +1,146 @@
+import gzip
+import logging
+import os
+import threading
+from datetime import datetime
+
+from scrape_logging import pin_extra
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+DEFAULT_CACHE_DIR = 'page_cache'  # Raw assessor pages, one directory per PIN
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # Evict the oldest pages once the cache grows past this
+EVICT_TO = 0.9  # Fraction of max_bytes the cache is trimmed down to
+
+_EXTENSIONS = {'gzip': '.html.gz', 'zstd': '.html.zst'}
+
+
+def _compress(data, compression):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, path):
+    if path.endswith(_EXTENSIONS['zstd']):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+# Compressed on-disk cache of fetched assessor pages, keyed by PIN and fetch time:
+#   <directory>/<PIN>/<YYYYmmddTHHMMSSffffff>.html.gz
+class PageCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, compression=None):
+        if compression is None:
+            compression = 'zstd' if zstandard is not None else 'gzip'
+        if compression not in _EXTENSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected 'gzip' or 'zstd'")
+        if compression == 'zstd' and zstandard is None:
+            raise RuntimeError("zstd compression needs the zstandard package")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._files())
+
+    # Function to list (mtime, path, size) of every cached page
+    def _files(self):
+        for pin_entry in os.scandir(self.directory):
+            if not pin_entry.is_dir():
+                continue
+            for entry in os.scandir(pin_entry.path):
+                if entry.name.endswith(tuple(_EXTENSIONS.values())):
+                    stat = entry.stat()
+                    yield stat.st_mtime, entry.path, stat.st_size
+
+    # Function to store a fetched page; returns the path it was written to, or None if it could not be
+    def put(self, pin, html_text, fetched_at=None):
+        try:
+            return self._put(pin, html_text, fetched_at)
+        except OSError as e:
+            # A full or unwritable disk must not cost us the page itself
+            logger.warning("Could not cache page for PIN %s: %s", pin, e, extra=pin_extra(pin))
+            return None
+
+    def _put(self, pin, html_text, fetched_at):
+        fetched_at = fetched_at or datetime.now()
+        pin_dir = os.path.join(self.directory, str(pin))
+        os.makedirs(pin_dir, exist_ok=True)
+        path = os.path.join(pin_dir, fetched_at.strftime('%Y%m%dT%H%M%S%f') + _EXTENSIONS[self.compression])
+
+        data = _compress(html_text.encode('utf-8'), self.compression)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    # Function to delete the oldest pages until the cache is back under EVICT_TO of max_bytes
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO
+        for mtime, path, size in sorted(self._files()):
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
+        logger.info("Page cache trimmed to %d bytes", self.total_bytes)
+
+    # Function to find the newest cached page file for a PIN
+    def _latest_path(self, pin_dir):
+        try:
+            names = [name for name in os.listdir(pin_dir) if name.endswith(tuple(_EXTENSIONS.values()))]
+        except FileNotFoundError:
+            return None
+        return os.path.join(pin_dir, max(names)) if names else None
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return _decompress(f.read(), path).decode('utf-8')
+
+    # Function to get the newest cached page for a PIN, or None
+    def latest(self, pin):
+        path = self._latest_path(os.path.join(self.directory, str(pin)))
+        return self._read(path) if path else None
+
+    # Function to yield (pin, html_text) with the newest cached page of every PIN
+    def iter_latest(self):
+        for pin_entry in os.scandir(self.directory):
+            if not pin_entry.is_dir():
+                continue
+            path = self._latest_path(pin_entry.path)
+            if path is None:
+                continue
+            try:
+                yield pin_entry.name, self._read(path)
+            except Exception as e:
+                logger.warning("Skipping unreadable cached page %s: %s", path, e)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+# Function to get the process-wide cache used by the Flask scrape services
+def default_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache()
+        return _default_cache
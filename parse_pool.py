@@ -0,0 +1,87 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from extractor import DEFAULT_BACKEND, parse_property_page
+from property_record import SOURCE_PIN
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 16  # Pages sent to a parse process per task; one round trip per chunk, not per page
+CHUNK_TIMEOUT = 0.1  # Seconds a partial chunk waits for more pages before it is sent anyway
+
+
+# Function to count the cores this process may run on
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS and Windows
+        return os.cpu_count() or 1
+
+
+# Function to pick the number of parse processes: one per core, less the core the fetch and write
+# threads run on. 0 on a single core, where parsing stays in threads.
+def default_process_count():
+    return max(available_cores() - 1, 0)
+
+
+# Function run in a parse process: parse a chunk of (PIN, page) pairs into PropertyDetail records.
+# Pages may be bytes (decoded as UTF-8) or text; failed pages come back as None.
+def _parse_chunk(backend, pages):
+    records = []
+    for pin, html in pages:
+        try:
+            if isinstance(html, bytes):
+                html = html.decode('utf-8', 'replace')
+            record = parse_property_page(html, pin, backend)
+            record[SOURCE_PIN] = pin
+        except Exception as e:
+            logger.warning("Could not parse the page of PIN %s: %s", pin, e)
+            record = None
+        records.append(record)
+    return records
+
+
+# Parses assessor pages in a pool of worker processes, so extraction is not held to one core by the GIL.
+# Pages go in as raw HTML, PropertyDetail records come back, pickled as plain tuples of their values.
+# Safe to use from many threads: each parse_chunk() call blocks its thread until its chunk is parsed.
+class ParsePool:
+    def __init__(self, processes=None, backend=DEFAULT_BACKEND, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.processes = processes or max(default_process_count(), 1)
+        self.backend = backend
+        self.chunk_size = chunk_size
+        # Spawned rather than forked: the scraper forks from a process full of threads
+        self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+        logger.info("Parsing in %d processes, %d pages per task", self.processes, chunk_size)
+
+    # Function to parse a list of (PIN, page) pairs; returns their records in order, None for pages that failed
+    def parse_chunk(self, pages):
+        return self._executor.submit(_parse_chunk, self.backend, list(pages)).result()
+
+    # Function to parse one page
+    def parse_page(self, html, pin):
+        return self.parse_chunk([(pin, html)])[0]
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+# Function to get the process-wide parse pool used by the Flask scrape services, or None on a single core
+def default_parse_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None and default_process_count() > 0:
+            _default_pool = ParsePool()
+        return _default_pool
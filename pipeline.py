@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 64  # Items buffered between two stages before the upstream stage blocks
+
+_DONE = object()  # Tells a worker that its input is exhausted
+
+
+# One step of a pipeline: func is called on every item (or on a list of items when
+# batch_size is set) by `workers` threads. Returning None drops the item.
+# With expand, func returns a list whose items are passed on one by one (None items are dropped).
+# With setup, each worker calls setup() once and func is called as func(state, item);
+# teardown(state) runs when the worker exits.
+class Stage:
+    def __init__(self, name, func, workers=1, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=None, batch_timeout=1.0, setup=None, teardown=None, expand=False):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.setup = setup
+        self.teardown = teardown
+        self.expand = expand
+        self.processed = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _count(self, errors=0):
+        with self._lock:
+            self.processed += 1
+            self.errors += errors
+
+
+# Function to stream items from source through the stages with bounded buffers between them.
+# Returns the stages once every item has been processed; an error raised by source is re-raised.
+# With metrics, the time each stage spends per item (or batch) is recorded under the stage's name.
+def run_pipeline(source, stages, metrics=None):
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+    source_error = []
+
+    def feed():
+        try:
+            for item in source:
+                queues[0].put(item)
+        except Exception as e:
+            logger.error("Pipeline source failed: %s", e)
+            source_error.append(e)
+        finally:
+            for _ in range(stages[0].workers):
+                queues[0].put(_DONE)
+
+    def work(index):
+        stage = stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        state = None
+
+        def process(item):
+            start = time.perf_counter()
+            try:
+                result = stage.func(state, item) if stage.setup else stage.func(item)
+            except Exception as e:
+                logger.warning("Stage %s failed: %s", stage.name, e)
+                stage._count(errors=1)
+                if metrics is not None:
+                    metrics.inc('stage_errors_total', stage=stage.name)
+                return
+            stage._count()
+            if metrics is not None:
+                metrics.observe(stage.name, time.perf_counter() - start)
+            if result is None or outbox is None:
+                return
+            if stage.expand:
+                for each in result:
+                    if each is not None:
+                        outbox.put(each)
+            else:
+                outbox.put(result)
+
+        try:
+            if stage.setup:
+                state = stage.setup()
+            batch = []
+            while True:
+                try:
+                    # Flush a partial batch if the input goes quiet
+                    timeout = stage.batch_timeout if batch else None
+                    item = inbox.get(timeout=timeout)
+                except queue.Empty:
+                    process(batch)
+                    batch = []
+                    continue
+
+                if item is _DONE:
+                    if batch:
+                        process(batch)
+                    break
+
+                if stage.batch_size:
+                    batch.append(item)
+                    if len(batch) >= stage.batch_size:
+                        process(batch)
+                        batch = []
+                else:
+                    process(item)
+        except Exception as e:
+            # Keep draining so upstream stages never block on a dead worker
+            logger.error("Stage %s worker stopped: %s", stage.name, e)
+            while inbox.get() is not _DONE:
+                stage._count(errors=1)
+        finally:
+            if stage.teardown and state is not None:
+                stage.teardown(state)
+            finished(index)
+
+    remaining = [stage.workers for stage in stages]
+    remaining_lock = threading.Lock()
+
+    # The last worker of a stage to exit closes the next stage's input
+    def finished(index):
+        with remaining_lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last and index + 1 < len(stages):
+            for _ in range(stages[index + 1].workers):
+                queues[index + 1].put(_DONE)
+
+    threads = [threading.Thread(target=feed, name='pipeline-source', daemon=True)]
+    for index, stage in enumerate(stages):
+        for n in range(stage.workers):
+            threads.append(threading.Thread(target=work, args=(index,), name=f'{stage.name}-{n}', daemon=True))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if source_error:
+        raise source_error[0]
+    return stages
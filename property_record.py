@@ -0,0 +1,113 @@
+import hashlib
+
+SOURCE_PIN = 'SourcePin'  # Key carrying the properties.PIN a scraped row came from
+
+# The one registry of property_details columns: (assessor page label, column), in table order.
+# The record type, the label lookup used by the parser and the upsert query all come from it.
+COLUMNS = (
+    ('Pin', 'Pin'),
+    ('Address', 'Address'),
+    ('City', 'City'),
+    ('Township', 'Township'),
+    ('Property Classification', 'PropertyClassification'),
+    ('Square Footage (Land)', 'SquareFootage'),
+    ('Neighborhood', 'Neighborhood'),
+    ('Taxcode', 'Taxcode'),
+    ('Next Scheduled Reassessment', 'NextScheduledReassessment'),
+    ('Description', 'Description'),
+    ('Age', 'Age'),
+    ('Building Square Footage', 'BuildingSquareFootage'),
+    ('Assessment Phase', 'AssessmentPhase'),
+    ('Previous Board Certified', 'PreviousBoardCertified'),
+    ('Status', 'Status'),
+    ('Assessor Valuation', 'AssessorValuation'),
+    ('Assessor Post-Appeal Valuation', 'AssessorPostAppealValuation'),
+    ('Appeal Number', 'AppealNumber'),
+    ('Attorney/Tax Representative', 'AttorneyTaxRepresentative'),
+    ('Applicant', 'Applicant'),
+    ('Result', 'Result'),
+    ('Reason', 'Reason'),
+    ('Tax Year', 'TaxYear'),
+    ('Certificate Number', 'CertificateNumber'),
+    ('Property Location', 'PropertyLocation'),
+    ('C of E Description', 'COfEDescription'),
+    ('Comments', 'Comments'),
+    ('Residence Type', 'ResidenceType'),
+    ('Use', 'Use'),
+    ('Apartments', 'Apartments'),
+    ('Exterior Construction', 'ExteriorConstruction'),
+    ('Full Baths', 'FullBaths'),
+    ('Half Baths', 'HalfBaths'),
+    ('Basement1', 'Basement1'),
+    ('Attic', 'Attic'),
+    ('Central Air', 'CentralAir'),
+    ('Number of Fireplaces', 'NumberOfFireplaces'),
+    ('Garage Size/Type2', 'GarageSizeType2'),
+)
+
+# Mapping of web page labels to database columns
+LABEL_TO_COLUMN = dict(COLUMNS)
+COLUMN_NAMES = tuple(column for _, column in COLUMNS)
+
+
+# Function to rebuild a pickled PropertyDetail from its slot values
+def _restore(values):
+    record = PropertyDetail.__new__(PropertyDetail)
+    for name, value in zip(PropertyDetail.__slots__, values):
+        setattr(record, name, value)
+    return record
+
+
+# One scraped parcel: a fixed slot per column (None until set) plus the properties.PIN it came from.
+# Far smaller than a dict per row, and it is the same object from the parser to the INSERT.
+# Item access (record['Pin'], record.get('Pin')) works as it did on the row dicts.
+class PropertyDetail:
+    __slots__ = COLUMN_NAMES + (SOURCE_PIN,)
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        try:
+            setattr(self, name, value)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __eq__(self, other):
+        if not isinstance(other, PropertyDetail):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__
+                           if getattr(self, name) is not None)
+        return f'PropertyDetail({values})'
+
+    # Pickled as a plain tuple of values, without the slot names, e.g. on the way back from a parse process
+    def __reduce__(self):
+        return _restore, (tuple(getattr(self, name) for name in self.__slots__),)
+
+    # Function to get the column values in table order, as the upsert query's parameters
+    def as_params(self):
+        return tuple(getattr(self, name) for name in COLUMN_NAMES)
+
+    # Function to get a 16 byte digest of the column values, to tell whether a stored row would change
+    def fingerprint(self):
+        text = '\x1f'.join('\x00' if value is None else str(value) for value in self.as_params())
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    # Function to get the columns as a plain dict (e.g. for JSON)
+    def to_dict(self):
+        return {name: getattr(self, name) for name in COLUMN_NAMES}
@@ -0,0 +1,84 @@
+import logging
+
+import mysql.connector
+
+from db_executor import is_transient
+from property_record import COLUMN_NAMES
+from scrape_logging import pin_extra
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200  # Rows sent per multi-row INSERT and committed per transaction
+
+
+# Function to build the statement inserting or updating one row of table, with the columns of the
+# shared registry as positional parameters (PropertyDetail.as_params order)
+def build_upsert_query(table='property_details'):
+    columns = ', '.join(f'`{name}`' for name in COLUMN_NAMES)
+    placeholders = ', '.join(['%s'] * len(COLUMN_NAMES))
+    updates = ',\n        '.join(f'`{name}` = VALUES(`{name}`)' for name in COLUMN_NAMES if name != 'Pin')
+    return f"""
+    INSERT INTO {table} ({columns})
+    VALUES ({placeholders})
+    ON DUPLICATE KEY UPDATE
+        {updates}
+"""
+
+
+# Prepared statement for inserting or updating one property_details row
+INSERT_QUERY = build_upsert_query()
+
+
+# Function to write one batch of rows in a single transaction
+def _write_batch(connection, rows, query, on_batch):
+    cursor = connection.cursor()
+    try:
+        connection.start_transaction()
+        # executemany rewrites the INSERT into one multi-row VALUES statement
+        cursor.executemany(query, [row.as_params() for row in rows])
+        if on_batch is not None:
+            on_batch(cursor, rows)
+        connection.commit()
+    except mysql.connector.Error:
+        try:
+            connection.rollback()
+        except mysql.connector.Error:
+            pass  # The connection is already gone
+        raise
+    finally:
+        cursor.close()
+
+
+# Function to upsert PropertyDetail rows into property_details in batches of batch_size, one transaction per batch.
+# Batches run on the executor's pooled connections, which retries transient errors (a dropped link,
+# a deadlock) with a short backoff; any other failure splits the batch in half until the offending
+# rows are isolated.
+# on_batch(cursor, rows), if given, runs inside each batch's transaction after the upsert.
+# Returns the rows that could not be written.
+def upsert_rows(executor, rows, query=INSERT_QUERY, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    failed = []
+    for start in range(0, len(rows), batch_size):
+        failed.extend(_upsert_batch(executor, rows[start:start + batch_size], query, on_batch))
+    return failed
+
+
+def _upsert_batch(executor, rows, query, on_batch):
+    try:
+        executor.run(lambda connection: _write_batch(connection, rows, query, on_batch))
+        executor.stats.add(queries=1)
+        return []
+    except mysql.connector.Error as e:
+        logger.warning("Error writing batch of %d rows: %s", len(rows), e)
+        if is_transient(e):
+            # Still failing after the executor's retries; splitting would not help
+            logger.error("Batch of %d rows failed after multiple attempts", len(rows))
+            return rows
+
+    if len(rows) == 1:
+        logger.error("Row for PIN %s could not be written", rows[0].Pin, extra=pin_extra(rows[0].Pin))
+        return rows
+
+    # Split the batch to find the bad row(s)
+    middle = len(rows) // 2
+    return (_upsert_batch(executor, rows[:middle], query, on_batch) +
+            _upsert_batch(executor, rows[middle:], query, on_batch))
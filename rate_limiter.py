@@ -0,0 +1,234 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 10.0  # Requests per second to start at
+MIN_RATE = 0.5  # Never slow down further than this
+MAX_RATE = 50.0  # Never speed up past this
+DEFAULT_BURST = 5  # Requests that may go out back to back after an idle spell
+TARGET_LATENCY = 2.0  # Responses slower than this (seconds) mean the site is struggling
+INCREASE_STEP = 0.1  # Additive increase per fast response, in requests per second
+SLOW_FACTOR = 0.9  # Multiplicative decrease on a slow response
+THROTTLE_FACTOR = 0.5  # Multiplicative decrease on a 429 or 503
+MAX_RETRY_AFTER = 300  # Ignore Retry-After values longer than this (seconds)
+
+THROTTLE_STATUSES = (429, 503)  # The site asking us to slow down
+
+DEFAULT_FAILURE_THRESHOLD = 10  # Consecutive failures that open the circuit
+DEFAULT_RESET_TIMEOUT = 30.0  # Seconds the circuit stays open before one probe request is let through
+
+DEFAULT_MAX_ATTEMPTS = 3  # Times a PIN is tried before it is given up on
+DEFAULT_RETRY_DELAY = 5.0  # Seconds before the first retry; doubled on every further attempt
+
+# Returned instead of a page when a PIN failed for a reason that may go away (throttling, 5xx, open circuit)
+RETRY_LATER = object()
+
+
+# Function to tell whether a response status is worth retrying later (throttling or a server error)
+def retryable_status(status):
+    return status in THROTTLE_STATUSES or status >= 500
+
+
+# Raised instead of sending a request that would have to wait retry_after seconds
+class RetryLaterError(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Raised instead of sending a request while the circuit is open
+class CircuitOpenError(RetryLaterError):
+    def __init__(self, retry_after):
+        super().__init__(f"Circuit open, retry in {retry_after:.0f}s", retry_after)
+
+
+# Raised instead of sleeping through a Retry-After pause, when the caller asked not to block
+class ThrottledError(RetryLaterError):
+    def __init__(self, retry_after):
+        super().__init__(f"Throttled by the site, retry in {retry_after:.0f}s", retry_after)
+
+
+# Function to turn a Retry-After header (seconds or an HTTP date) into seconds, or None
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+# Token bucket whose rate adapts to the site: additive increase while responses are fast,
+# multiplicative decrease when they slow down or the site answers 429/503, and a full pause
+# for as long as Retry-After asks
+class AdaptiveRateLimiter:
+    def __init__(self, rate=DEFAULT_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE, burst=DEFAULT_BURST,
+                 target_latency=TARGET_LATENCY):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.target_latency = target_latency
+        self.throttled = 0  # 429/503 responses seen
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    # Function to block until the next request may be sent. With block=False a Retry-After pause raises
+    # ThrottledError instead of being slept through; waiting for a token (at most 1/min_rate) still blocks.
+    def acquire(self, block=True):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                    if not block:
+                        raise ThrottledError(wait)
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    # Function to get the seconds until Retry-After allows requests again (0 when not paused)
+    def retry_in(self):
+        with self._lock:
+            return max(self._paused_until - time.monotonic(), 0.0)
+
+    # Function to adapt the rate to a response's status and latency
+    def observe(self, status, latency, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                # Requests already in flight come back throttled together; slow down once for all of them
+                if now - self._last_decrease >= 1.0:
+                    self.rate = max(self.min_rate, self.rate * THROTTLE_FACTOR)
+                    self._last_decrease = now
+                pause = retry_after if retry_after is not None else 1 / self.rate
+                self._paused_until = max(self._paused_until, now + pause)
+                self._tokens = 0.0
+                self._updated = max(now, self._paused_until)
+            elif latency > self.target_latency:
+                if now - self._last_decrease >= 1.0:
+                    self.rate = max(self.min_rate, self.rate * SLOW_FACTOR)
+                    self._last_decrease = now
+            elif status < 500:
+                self.rate = min(self.max_rate, self.rate + INCREASE_STEP)
+
+
+# Stops sending requests after repeated failures, then lets a single probe through after reset_timeout
+class CircuitBreaker:
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.opened = 0  # Times the circuit has opened
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        # Notified whenever the state changes, for requests waiting out an open circuit
+        self._changed = threading.Condition(self._lock)
+
+    # Function to let a request through if the circuit allows it; returns None when it may be sent,
+    # otherwise the seconds to wait. Called with the lock held.
+    def _admit(self):
+        if self.state == 'closed':
+            return None
+        remaining = self._opened_at + self.reset_timeout - time.monotonic()
+        if self.state == 'open' and remaining <= 0:
+            self.state = 'half_open'
+        if self.state == 'half_open' and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return None
+        return max(remaining, 1.0)
+
+    # Function to check that a request may be sent; raises CircuitOpenError otherwise
+    def before_request(self):
+        with self._lock:
+            retry_after = self._admit()
+            if retry_after is not None:
+                raise CircuitOpenError(retry_after)
+
+    # Function to block until a request may be sent: through the reset timeout while the circuit is open,
+    # and until the probe's outcome is known while it is half open
+    def wait_for_request(self):
+        with self._changed:
+            while (retry_after := self._admit()) is not None:
+                self._changed.wait(retry_after)
+
+    # Function to get the seconds until a request may be sent again (0 when the circuit is not open)
+    def retry_in(self):
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self.state = 'closed'
+            self._changed.notify_all()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == 'half_open' or (self.state == 'closed' and self._failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened += 1
+                self._opened_at = time.monotonic()
+                logger.warning("Circuit opened after %d consecutive failures, pausing requests for %.0fs",
+                               self._failures, self.reset_timeout)
+            self._changed.notify_all()
+
+
+# PINs that failed for a temporary reason, retried with exponential backoff up to max_attempts times
+class RetryQueue:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._attempts = {}
+        self._due = []  # (due time, pin) heap
+        self._lock = threading.Lock()
+
+    # Function to queue a failed PIN; returns False once it has used up its attempts
+    def put(self, pin):
+        with self._lock:
+            attempts = self._attempts.get(pin, 1)
+            if attempts >= self.max_attempts:
+                return False
+            self._attempts[pin] = attempts + 1
+            heapq.heappush(self._due, (time.monotonic() + self.retry_delay * 2 ** (attempts - 1), pin))
+            return True
+
+    def __len__(self):
+        return len(self._due)
+
+    # Function to take every queued PIN, waiting until the first of them is due
+    def take(self):
+        with self._lock:
+            if not self._due:
+                return []
+            wait = self._due[0][0] - time.monotonic()
+            pins = [pin for _, pin in sorted(self._due)]
+            self._due = []
+        if wait > 0:
+            time.sleep(wait)
+        return pins
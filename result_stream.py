@@ -0,0 +1,86 @@
+import json
+import queue
+import threading
+import time
+
+DEFAULT_PROGRESS_INTERVAL = 2.0  # Seconds between progress events, sent even while no PIN finishes
+
+# Stream formats and their content types
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+_END = object()  # Put on the queue when the results are exhausted
+
+
+# Function to pick a stream format from ?stream= or the Accept header; None for a plain JSON response
+def stream_format(requested, accept):
+    if requested:
+        return requested if requested in STREAM_FORMATS else None
+    for fmt, content_type in STREAM_FORMATS.items():
+        if content_type in (accept or ''):
+            return fmt
+    return None
+
+
+# Function to write one event: a JSON line with its type in 'event', or a Server-Sent Event
+def format_event(fmt, event, data):
+    if fmt == 'sse':
+        return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+    return json.dumps({'event': event, **data}) + '\n'
+
+
+# Function to stream per-PIN results as they are produced, with progress events in between.
+# results is an iterator of result dicts (each with a 'status'), run on a background thread so progress
+# events keep coming every progress_interval seconds even while no result does, which keeps proxies
+# from timing the response out. Yields the formatted 'result', 'progress' and final 'done' events.
+# stop is set when the client goes away, so the producer can stop taking on more work.
+def stream_results(results, total, fmt, stop, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    events = queue.Queue()
+
+    def produce():
+        try:
+            for result in results:
+                events.put(result)
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(_END)
+
+    threading.Thread(target=produce, name='result-stream', daemon=True).start()
+
+    start = time.monotonic()
+    counts = {}
+    done = 0
+
+    def progress():
+        elapsed = time.monotonic() - start
+        return {'done': done, 'total': total, **counts, 'elapsed_seconds': round(elapsed, 3),
+                'pins_per_second': round(done / elapsed, 2) if elapsed else 0.0}
+
+    try:
+        next_progress = start + progress_interval
+        while True:
+            try:
+                item = events.get(timeout=max(next_progress - time.monotonic(), 0))
+            except queue.Empty:
+                yield format_event(fmt, 'progress', progress())
+                next_progress = time.monotonic() + progress_interval
+                continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                yield format_event(fmt, 'error', {'error': str(item)})
+                break
+            done += 1
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+            yield format_event(fmt, 'result', item)
+            if time.monotonic() >= next_progress:
+                yield format_event(fmt, 'progress', progress())
+                next_progress = time.monotonic() + progress_interval
+
+        yield format_event(fmt, 'done', progress())
+    finally:
+        stop.set()
@@ -0,0 +1,195 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from shard_lease import default_owner
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4  # Jobs worked on at once
+DEFAULT_MAX_PENDING = 1000  # Queued jobs accepted before submit() refuses more
+DEFAULT_KEEP_SECONDS = 24 * 3600  # Finished jobs are kept this long for /jobs/<id>
+HEARTBEAT_SECONDS = 30  # How often a queue marks the jobs it is running as still alive
+STALE_SECONDS = 120  # A job with no heartbeat for this long lost its process and is queued again
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+JOBS_DDL = """
+    CREATE TABLE IF NOT EXISTS scrape_jobs (
+        id TEXT PRIMARY KEY,
+        pins TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        owner TEXT,
+        heartbeat_at REAL,
+        results TEXT,
+        error TEXT
+    )
+"""
+
+
+# Raised by submit() when the queue already holds max_pending jobs
+class JobQueueFull(Exception):
+    pass
+
+
+# Queue of scrape jobs worked on by a pool of background threads, with no broker: jobs are kept in
+# SQLite, in memory by default or in a file (path) so queued jobs survive a restart and are picked
+# up again. run_job(pins) does the work and returns the job's results (anything JSON serialisable).
+# start() starts the worker threads and recovers unfinished jobs; the services call it when they load.
+# Several processes may share one file (e.g. gunicorn workers): a job is claimed with a conditional
+# UPDATE, so only one of them runs it. Every job, queued or running, has an owning process that
+# heartbeats it, and is only queued again by another process once its owner has stopped heartbeating
+# for STALE_SECONDS. A process works on the jobs submitted to it, on those it finds queued when it
+# starts, and on those it finds stale whenever it heartbeats.
+class JobQueue:
+    def __init__(self, run_job, workers=DEFAULT_WORKERS, path=None, max_pending=DEFAULT_MAX_PENDING,
+                 keep_seconds=DEFAULT_KEEP_SECONDS, metrics=None):
+        self.run_job = run_job
+        self.workers = workers
+        self.path = path or ':memory:'
+        self.max_pending = max_pending
+        self.keep_seconds = keep_seconds
+        self.metrics = metrics
+        self.owner = default_owner()
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._db = None
+        self._threads = []
+
+    # Function to open the jobs file, start the worker and heartbeat threads and queue unfinished jobs again;
+    # only the first call does anything
+    def start(self):
+        with self._lock:
+            if self._db is not None:
+                return
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute(JOBS_DDL)
+            # Files written before jobs had owners get the columns
+            columns = {row['name'] for row in self._db.execute("PRAGMA table_info(scrape_jobs)")}
+            for column in ('owner TEXT', 'heartbeat_at REAL'):
+                if column.split()[0] not in columns:
+                    self._db.execute(f"ALTER TABLE scrape_jobs ADD COLUMN {column}")
+            self._db.commit()
+
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'scrape-job-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name='scrape-job-heartbeat', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        # Jobs queued by a previous process, or left by one that is gone, go back on the queue
+        self._requeue_unfinished(include_queued=True)
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+            self._db.commit()
+            return rows
+
+    # Function to run an UPDATE; returns the number of rows it changed
+    def _update(self, query, params=()):
+        with self._lock:
+            rowcount = self._db.execute(query, params).rowcount
+            self._db.commit()
+            return rowcount
+
+    # Function to take over queued and running jobs whose owner stopped heartbeating, and to put them, and all
+    # other queued jobs if include_queued, on this process's queue
+    def _requeue_unfinished(self, include_queued=False):
+        now = time.time()
+        stale_before = now - STALE_SECONDS
+        requeued = set()
+        rows = self._execute("SELECT id FROM scrape_jobs WHERE status IN (?, ?) AND COALESCE(heartbeat_at, 0) < ? "
+                             "ORDER BY created_at", (QUEUED, RUNNING, stale_before))
+        for row in rows:
+            # Another process may requeue or claim the same job at the same time; only one update wins
+            if self._update("UPDATE scrape_jobs SET status = ?, owner = ?, heartbeat_at = ?, started_at = NULL "
+                            "WHERE id = ? AND status IN (?, ?) AND COALESCE(heartbeat_at, 0) < ?",
+                            (QUEUED, self.owner, now, row['id'], QUEUED, RUNNING, stale_before)):
+                self._pending.put(row['id'])
+                requeued.add(row['id'])
+        if include_queued:
+            # Queued jobs of a live owner are claimed by whichever process gets to them first
+            rows = self._execute("SELECT id FROM scrape_jobs WHERE status = ? ORDER BY created_at", (QUEUED,))
+            for row in rows:
+                if row['id'] not in requeued:
+                    self._pending.put(row['id'])
+                    requeued.add(row['id'])
+        if requeued:
+            logger.info("Requeued %d unfinished scrape jobs", len(requeued))
+
+    # Function run by a background thread: keep this process's queued and running jobs alive and pick up stale ones
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                self._update("UPDATE scrape_jobs SET heartbeat_at = ? WHERE status IN (?, ?) AND owner = ?",
+                             (time.time(), QUEUED, RUNNING, self.owner))
+                self._requeue_unfinished()
+            except sqlite3.Error as e:
+                logger.warning("Could not heartbeat scrape jobs: %s", e)
+
+    # Function to queue a job for a list of PINs; returns its ID at once
+    def submit(self, pins):
+        self.start()
+        if self._pending.qsize() >= self.max_pending:
+            raise JobQueueFull(f"{self.max_pending} scrape jobs are already queued")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        # Finished jobs nobody asked about for a day are forgotten
+        self._execute("DELETE FROM scrape_jobs WHERE finished_at < ?", (now - self.keep_seconds,))
+        # This process owns the job until a worker claims it, and heartbeats it while it waits
+        self._execute("INSERT INTO scrape_jobs (id, pins, status, created_at, owner, heartbeat_at) "
+                      "VALUES (?, ?, ?, ?, ?, ?)", (job_id, json.dumps(pins), QUEUED, now, self.owner, now))
+        self._pending.put(job_id)
+        if self.metrics is not None:
+            self.metrics.inc('jobs_submitted_total')
+        return job_id
+
+    # Function to get a job as a dict (id, status, pins, results, error and timestamps), or None if unknown
+    def get(self, job_id):
+        self.start()
+        rows = self._execute("SELECT * FROM scrape_jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        del job['owner']  # Host and process names are not for API callers
+        job['pins'] = json.loads(job['pins'])
+        job['results'] = json.loads(job['results']) if job['results'] is not None else None
+        return job
+
+    def _work(self):
+        while True:
+            job_id = self._pending.get()
+            # Claimed only if still queued: another worker or process may have taken it already
+            now = time.time()
+            if not self._update("UPDATE scrape_jobs SET status = ?, owner = ?, started_at = ?, heartbeat_at = ? "
+                                "WHERE id = ? AND status = ?", (RUNNING, self.owner, now, now, job_id, QUEUED)):
+                continue
+            rows = self._execute("SELECT pins FROM scrape_jobs WHERE id = ?", (job_id,))
+
+            try:
+                results = self.run_job(json.loads(rows[0]['pins']))
+                # A job requeued while this process stalled belongs to another owner now, whose result is kept
+                self._update("UPDATE scrape_jobs SET status = ?, finished_at = ?, results = ? "
+                             "WHERE id = ? AND owner = ?",
+                             (DONE, time.time(), json.dumps(results), job_id, self.owner))
+                status = DONE
+            except Exception as e:
+                logger.exception("Scrape job %s failed", job_id)
+                self._update("UPDATE scrape_jobs SET status = ?, finished_at = ?, error = ? "
+                             "WHERE id = ? AND owner = ?", (FAILED, time.time(), str(e), job_id, self.owner))
+                status = FAILED
+            if self.metrics is not None:
+                self.metrics.inc('jobs_finished_total', status=status)
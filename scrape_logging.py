@@ -0,0 +1,121 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import zlib
+
+DEFAULT_LEVEL = 'INFO'  # Per-PIN lines are DEBUG, so the default only shows batches, progress and problems
+DEFAULT_SAMPLE_RATE = 1.0  # Share of PINs whose per-PIN lines are kept
+DEFAULT_QUEUE_SIZE = 10000  # Log records buffered for the writer thread; more than this are dropped
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# extra= for end-of-run summaries, the only lines (besides errors) kept in summary-only mode
+SUMMARY = {'summary': True}
+
+
+# Function to build the extra= of a per-PIN line, so it can be sampled and searched by PIN
+def pin_extra(pin):
+    return {'pin': str(pin)}
+
+
+# Keeps the per-PIN lines of a fixed share of PINs: the same PINs every time, with all of their lines.
+# Warnings and errors always pass.
+class PinSampleFilter(logging.Filter):
+    def __init__(self, rate=DEFAULT_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        pin = getattr(record, 'pin', None)
+        if pin is None or record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return zlib.crc32(pin.encode()) / 2 ** 32 < self.rate
+
+
+# Keeps only summaries and errors
+class SummaryOnlyFilter(logging.Filter):
+    def filter(self, record):
+        return getattr(record, 'summary', False) or record.levelno >= logging.ERROR
+
+
+# One JSON object per line, with the PIN as its own field when there is one
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'pin', None) is not None:
+            entry['pin'] = record.pin
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+# Hands records to the writer thread without ever waiting: when the buffer is full the record is
+# dropped (and counted) rather than blocking a fetch or write
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+
+
+# Function to send every log line through a background writer thread.
+# level: minimum level; sample_rate: share of PINs whose per-PIN lines are kept;
+# summary_only: only end-of-run summaries and errors; fmt: 'text' or 'json'; path: log file instead of stderr
+def configure_logging(level=DEFAULT_LEVEL, sample_rate=DEFAULT_SAMPLE_RATE, summary_only=False, fmt='text',
+                      path=None, queue_size=DEFAULT_QUEUE_SIZE):
+    global _listener, _handler
+    stop_logging()
+
+    output = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    # Filtering happens on the calling thread so dropped lines are never formatted or queued
+    _handler = DroppingQueueHandler(queue.Queue(queue_size))
+    _handler.addFilter(SummaryOnlyFilter() if summary_only else PinSampleFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    # Third-party request logs are noise at scrape rates
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output)
+    _listener.start()
+    return _handler
+
+
+# Function to write out the buffered lines and stop the writer thread
+def stop_logging():
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        if _handler.dropped:
+            _listener.handlers[0].handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f'{_handler.dropped} log lines dropped because the log buffer was full'}))
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger().removeHandler(_handler)
+        _listener = None
+        _handler = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,151 @@
+# Scraping and storing a single PIN, shared by the Flask scrape services (data_scrape_update.py and
+# data_scrape_per_pin_number.py). Requests go through the process-wide client, page cache and parse pool.
+import logging
+import math
+import time
+
+import requests
+from mysql.connector import Error
+
+from cleaning import clean_records
+from extractor import parse_property_page
+from http_client import NOT_MODIFIED, default_client
+from metrics import default_metrics
+from page_cache import default_cache
+from parse_pool import default_parse_pool
+from property_upsert import upsert_rows
+from rate_limiter import RETRY_LATER, RetryLaterError, retryable_status
+from scrape_logging import pin_extra
+from single_flight import SingleFlightCache
+
+logger = logging.getLogger(__name__)
+
+# URL base for fetching property details
+BASE_URL = 'https://www.cookcountyassessor.com/pin/'
+
+RESULT_TTL = 300  # Seconds a successful /scrape-property response is reused for the same PIN
+
+# Recent /scrape-property responses by PIN, shared by both services. Requests for a PIN already being scraped
+# wait for that scrape; successful responses are served again for RESULT_TTL seconds without the assessor
+# site or MySQL.
+result_cache = SingleFlightCache(ttl=RESULT_TTL, cacheable=lambda response: response[1] in (200, 201),
+                                 metrics=default_metrics(), name='result_cache')
+
+
+# Function to scrape data for a given PIN number
+# Returns NOT_MODIFIED when the page is unchanged since it was last scraped,
+# RETRY_LATER when the assessor site is throttling or failing
+def scrape_property_data(pin_number):
+    url = f'{BASE_URL}{pin_number}#address'
+
+    try:
+        # Shared keep-alive session with conditional GET
+        response = default_client().get(url, key=str(pin_number))
+        if response is NOT_MODIFIED:
+            return NOT_MODIFIED
+        if response.status_code == 200:
+            html_text = response.text
+            # Keep the raw page so later fixes can be backfilled without the network
+            default_cache().put(pin_number, html_text)
+
+            # Only the detail-row labels and values are extracted from the page, in the shared parse
+            # processes when there is more than one core, so parsing does not hold other requests' threads
+            start = time.perf_counter()
+            parse_pool = default_parse_pool()
+            if parse_pool is not None:
+                property_data = parse_pool.parse_page(html_text, str(pin_number))
+            else:
+                property_data = parse_property_page(html_text, pin_number)
+            default_metrics().observe('parse', time.perf_counter() - start)
+
+            return property_data
+
+        else:
+            logger.info("Failed to retrieve page for PIN %s, status code: %d", pin_number, response.status_code,
+                        extra=pin_extra(pin_number))
+            if retryable_status(response.status_code):
+                return RETRY_LATER
+            return None
+
+    # The site is failing or has asked us to pause: the caller gets a 503 with Retry-After at once
+    # instead of a request thread sleeping through the pause
+    except RetryLaterError:
+        return RETRY_LATER
+
+    except requests.RequestException as e:
+        logger.info("Request failed for PIN %s: %s", pin_number, e, extra=pin_extra(pin_number))
+        return RETRY_LATER
+
+
+# Function to drop the validators the shared client saved for a PIN whose row was not stored, so its
+# page is downloaded again next time instead of coming back as 304 "unchanged"
+def forget_validators(pin_number):
+    default_client().validators.forget(str(pin_number))
+
+
+# Function to tell a caller when to retry, from the shared client's circuit breaker and rate limiter
+def retry_after_seconds():
+    client = default_client()
+    return math.ceil(max(client.breaker.retry_in(), client.rate_limiter.retry_in(), 1.0))
+
+
+# Function to scrape one PIN and upsert its row through executor (a DbExecutor);
+# returns the response as (body, status, headers)
+def scrape_and_store_property(pin_number, executor):
+    # Scrape property data
+    property_data = scrape_property_data(pin_number)
+
+    # Nothing to parse or write when the assessor page has not changed
+    if property_data is NOT_MODIFIED:
+        return {'message': f'Property details for PIN {pin_number} are unchanged'}, 200, {}
+
+    # The assessor site is throttling or down; ask the caller to come back instead of failing
+    if property_data is RETRY_LATER:
+        retry_after = retry_after_seconds()
+        return ({'error': f'Assessor site unavailable, retry PIN {pin_number} in {retry_after}s'},
+                503, {'Retry-After': str(retry_after)})
+
+    if not property_data:
+        forget_validators(pin_number)
+        return {'error': f'Failed to scrape data for PIN {pin_number}'}, 500, {}
+
+    try:
+        # The same cleaning as the batch scraper and /scrape-properties: a page whose PIN or square footage
+        # is not a number is refused rather than stored
+        rows, rejected = clean_records([property_data])
+        if rejected:
+            forget_validators(pin_number)
+            return {'error': f'Invalid PIN or square footage on the assessor page for PIN {pin_number}'}, 500, {}
+
+        # One transaction on a pooled connection; transient errors are retried with a short backoff
+        start = time.perf_counter()
+        failed = upsert_rows(executor, rows, batch_size=1)
+        default_metrics().observe('write', time.perf_counter() - start)
+        if failed:
+            forget_validators(pin_number)
+            return {'error': 'Error inserting/updating data into MySQL database'}, 500, {}
+        default_metrics().inc('rows_written_total')
+
+        return {'message': f'Property details for PIN {pin_number} inserted/updated successfully'}, 201, {}
+
+    except Error as e:
+        forget_validators(pin_number)
+        return {'error': f'Error inserting/updating data into MySQL database: {e}'}, 500, {}
+
+    except Exception:
+        forget_validators(pin_number)
+        raise
+
+
+# Function to scrape and store one PIN through result_cache; returns (body, status, headers) like
+# scrape_and_store_property, with an X-Cache header saying whether it was a MISS, COALESCED or HIT
+def scrape_and_store_cached(pin_number, executor):
+    (body, status, headers), outcome = result_cache.get(str(pin_number),
+                                                        lambda: scrape_and_store_property(pin_number, executor))
+    return body, status, {**headers, 'X-Cache': outcome.upper()}
+
+
+# Function to drop a PIN's cached /scrape-property response once its row has been written (or failed to be)
+# by a batch, stream or job, so the next /scrape-property request scrapes it again
+def forget_result(pin_number):
+    result_cache.forget(str(pin_number))
@@ -0,0 +1,254 @@
+import logging
+import queue
+import re
+
+from property_record import SOURCE_PIN
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE_DAYS = 30  # Rescrape any PIN not scraped for this long
+DEFAULT_DUE_MAX_AGE_DAYS = 1  # ...or for this long when its reassessment is due soon
+DEFAULT_LOOKAHEAD_YEARS = 0  # "Due soon": next reassessment no later than this many years from now
+WORKLIST_PAGE_SIZE = 5000  # PINs read per worklist query
+
+# Last time each properties.PIN was scraped, the year of its next scheduled reassessment, and the
+# fingerprint of the row last stored for it (PropertyDetail.fingerprint)
+SCRAPE_STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS property_scrape_state (
+        `Pin` BIGINT NOT NULL PRIMARY KEY,
+        `LastScrapedAt` DATETIME NOT NULL,
+        `NextReassessmentYear` SMALLINT NULL,
+        `ContentHash` BINARY(16) NULL,
+        INDEX idx_last_scraped (`LastScrapedAt`),
+        INDEX idx_next_reassessment (`NextReassessmentYear`, `LastScrapedAt`)
+    )
+"""
+
+# Tables created before content hashes were kept get the column added
+CONTENT_HASH_COLUMN_DDL = "ALTER TABLE property_scrape_state ADD COLUMN `ContentHash` BINARY(16) NULL"
+
+# One row per batch run, so an interrupted run can be resumed
+SCRAPE_RUNS_DDL = """
+    CREATE TABLE IF NOT EXISTS scrape_runs (
+        `RunId` INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        `StartedAt` DATETIME NOT NULL,
+        `FinishedAt` DATETIME NULL
+    )
+"""
+
+# property_details stores the 14 digit PIN; 10 digit properties.PINs are padded with 0000
+DETAILS_PIN_EXPR = "(CASE WHEN p.PIN < 10000000000 THEN p.PIN * 10000 ELSE p.PIN END)"
+
+# Shard of a properties.PIN: its area/subarea, the first 4 digits of the 14 digit PIN
+SHARD_EXPR = "(CASE WHEN p.PIN < 10000000000 THEN p.PIN DIV 1000000 ELSE p.PIN DIV 10000000000 END)"
+
+# One page of PINs to scrape, flagged when property_details has no row for them, with the fingerprint
+# of the row last stored.
+# Keyset pagination on the primary key: every page is an index range scan, however deep into the table.
+WORKLIST_QUERY = f"""
+    SELECT p.PropertyID, p.PIN, d.Pin IS NULL AS Missing, s.ContentHash
+    FROM properties p
+    LEFT JOIN property_scrape_state s ON s.Pin = p.PIN
+    LEFT JOIN property_details d ON d.Pin = {DETAILS_PIN_EXPR}
+    WHERE p.PropertyID > %(after_id)s AND {{conditions}}
+    ORDER BY p.PropertyID
+    LIMIT %(page_size)s
+"""
+
+# Only PINs that are new, missing from property_details, stale, or due for reassessment soon
+INCREMENTAL_CONDITION = """
+    (s.Pin IS NULL
+     OR d.Pin IS NULL
+     OR s.LastScrapedAt < NOW() - INTERVAL %(max_age_days)s DAY
+     OR (s.NextReassessmentYear <= YEAR(CURDATE()) + %(lookahead_years)s
+         AND s.LastScrapedAt < NOW() - INTERVAL %(due_max_age_days)s DAY))
+"""
+
+# Skip PINs an interrupted run already stored
+RESUME_CONDITION = "(s.Pin IS NULL OR s.LastScrapedAt < %(resume_since)s)"
+
+# Only PINs of one shard; as ranges over both PIN lengths so the primary key index is used
+SHARD_CONDITION = """
+    (p.PIN BETWEEN %(shard_low_10)s AND %(shard_high_10)s
+     OR p.PIN BETWEEN %(shard_low_14)s AND %(shard_high_14)s)
+"""
+
+# Both take the state table's name: property_scrape_state, or a full refresh's staging copy of it
+RECORD_SCRAPED_QUERY = """
+    INSERT INTO {table} (`Pin`, `LastScrapedAt`, `NextReassessmentYear`, `ContentHash`)
+    VALUES (%s, NOW(), %s, %s)
+    ON DUPLICATE KEY UPDATE
+        `LastScrapedAt` = VALUES(`LastScrapedAt`),
+        `NextReassessmentYear` = VALUES(`NextReassessmentYear`),
+        `ContentHash` = VALUES(`ContentHash`)
+"""
+
+RECORD_UNCHANGED_QUERY = """
+    INSERT INTO {table} (`Pin`, `LastScrapedAt`)
+    VALUES (%s, NOW())
+    ON DUPLICATE KEY UPDATE `LastScrapedAt` = VALUES(`LastScrapedAt`)
+"""
+
+
+# Function to create the scrape state tables if they do not exist yet
+def ensure_scrape_state_table(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(SCRAPE_STATE_DDL)
+        cursor.execute("SHOW COLUMNS FROM property_scrape_state LIKE 'ContentHash'")
+        if not cursor.fetchall():
+            cursor.execute(CONTENT_HASH_COLUMN_DDL)
+        cursor.execute(SCRAPE_RUNS_DDL)
+    finally:
+        cursor.close()
+
+
+# Function to register a run. With resume, the newest unfinished run is continued instead.
+# Returns (run_id, resume_since) where resume_since is the start time of the resumed run or None.
+def start_run(connection, resume=False):
+    cursor = connection.cursor()
+    try:
+        if resume:
+            cursor.execute("SELECT RunId, StartedAt FROM scrape_runs WHERE FinishedAt IS NULL "
+                           "ORDER BY RunId DESC LIMIT 1")
+            row = cursor.fetchone()
+            if row:
+                logger.info("Resuming run %s started at %s", row[0], row[1])
+                return row[0], row[1]
+            logger.info("No interrupted run to resume, starting a new one")
+
+        cursor.execute("INSERT INTO scrape_runs (StartedAt) VALUES (NOW())")
+        run_id = cursor.lastrowid
+        connection.commit()
+        return run_id, None
+    finally:
+        cursor.close()
+
+
+# Function to mark a run as complete so --resume no longer picks it up
+def finish_run(connection, run_id):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("UPDATE scrape_runs SET FinishedAt = NOW() WHERE RunId = %s", (run_id,))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+# Function to get the PIN ranges of a shard: 10 digit PINs AAAA######, 14 digit PINs AAAA##########
+def shard_bounds(shard):
+    return {
+        'shard_low_10': shard * 10 ** 6,
+        'shard_high_10': (shard + 1) * 10 ** 6 - 1,
+        # Shard 0 has no 14 digit PINs: anything below 10**10 is a 10 digit PIN
+        'shard_low_14': max(shard * 10 ** 10, 10 ** 10),
+        'shard_high_14': (shard + 1) * 10 ** 10 - 1,
+    }
+
+
+# Function to stream the PINs to scrape as (pin, missing, content_hash), page_size at a time; missing
+# PINs have no property_details row, content_hash is the fingerprint of the row last stored (or None).
+# resume_since skips PINs stored since that time, i.e. by the run
+# being resumed; shard limits it to one shard. Memory and time to the first PIN do not grow with
+# the properties table.
+def iter_worklist(connection, incremental=False, max_age_days=DEFAULT_MAX_AGE_DAYS,
+                  due_max_age_days=DEFAULT_DUE_MAX_AGE_DAYS, lookahead_years=DEFAULT_LOOKAHEAD_YEARS,
+                  resume_since=None, shard=None, page_size=WORKLIST_PAGE_SIZE):
+    conditions = ['TRUE']
+    params = {
+        'max_age_days': max_age_days,
+        'due_max_age_days': due_max_age_days,
+        'lookahead_years': lookahead_years,
+        'resume_since': resume_since,
+        'page_size': page_size,
+    }
+    if incremental:
+        conditions.append(INCREMENTAL_CONDITION)
+    if resume_since is not None:
+        conditions.append(RESUME_CONDITION)
+    if shard is not None:
+        conditions.append(SHARD_CONDITION)
+        params.update(shard_bounds(shard))
+
+    query = WORKLIST_QUERY.format(conditions=' AND '.join(conditions))
+    after_id = -1
+    while True:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, dict(params, after_id=after_id))
+            page = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        for property_id, pin, missing, content_hash in page:
+            yield str(pin), bool(missing), content_hash
+        if len(page) < page_size:
+            return
+        after_id = page[-1][0]
+
+
+# Function to get the (estimated) number of properties without counting them
+def estimate_property_count(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'properties'")
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row[0] if row else None
+
+
+# Function to pull the year out of a scraped NextScheduledReassessment value such as '2027'
+def reassessment_year(value):
+    match = re.search(r'\b(\d{4})\b', value) if isinstance(value, str) else None
+    return int(match.group(1)) if match else None
+
+
+# Records when each PIN was scraped, in the same transaction as the rows it wrote, into table
+class ScrapeStateRecorder:
+    def __init__(self, table='property_scrape_state'):
+        self.table = table
+        self._record_scraped = RECORD_SCRAPED_QUERY.format(table=table)
+        self._record_unchanged = RECORD_UNCHANGED_QUERY.format(table=table)
+        self._unchanged = queue.SimpleQueue()
+
+    # Function to note a PIN whose page came back 304 Not Modified
+    def mark_unchanged(self, pin):
+        self._unchanged.put(pin)
+
+    def _drain_unchanged(self):
+        pins = []
+        while True:
+            try:
+                pins.append((self._unchanged.get_nowait(),))
+            except queue.Empty:
+                return pins
+
+    # upsert_rows hook: runs inside the batch transaction
+    def record(self, cursor, rows):
+        cursor.executemany(self._record_scraped, [
+            (row[SOURCE_PIN], reassessment_year(row.get('NextScheduledReassessment')), row.fingerprint())
+            for row in rows
+        ])
+        unchanged = self._drain_unchanged()
+        if unchanged:
+            try:
+                cursor.executemany(self._record_unchanged, unchanged)
+            except Exception:
+                # The batch is retried or split; the next attempt records them
+                for (pin,) in unchanged:
+                    self._unchanged.put(pin)
+                raise
+
+    # Function to record the unchanged PINs no batch has picked up yet
+    def flush(self, connection):
+        unchanged = self._drain_unchanged()
+        if not unchanged:
+            return
+        cursor = connection.cursor()
+        try:
+            cursor.executemany(self._record_unchanged, unchanged)
+            connection.commit()
+        finally:
+            cursor.close()
@@ -0,0 +1,171 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from scrape_state import SHARD_EXPR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300  # A shard whose owner stops heartbeating is handed out again after this
+MAX_ATTEMPTS = 3  # Shards that failed this many times are marked failed instead of retried forever
+
+# One row per area/subarea shard of the crawl and the worker currently leasing it
+SCRAPE_SHARDS_DDL = """
+    CREATE TABLE IF NOT EXISTS scrape_shards (
+        `ShardKey` SMALLINT NOT NULL PRIMARY KEY,
+        `Status` VARCHAR(16) NOT NULL DEFAULT 'pending',
+        `Owner` VARCHAR(128) NULL,
+        `LeaseExpiresAt` DATETIME NULL,
+        `Attempts` INT NOT NULL DEFAULT 0,
+        `StartedAt` DATETIME NULL,
+        `CompletedAt` DATETIME NULL,
+        INDEX idx_status_lease (`Status`, `LeaseExpiresAt`)
+    )
+"""
+
+# Every shard with at least one property; existing shards keep their state
+SEED_SHARDS_QUERY = f"INSERT IGNORE INTO scrape_shards (`ShardKey`) SELECT DISTINCT {SHARD_EXPR} FROM properties p"
+
+RESET_SHARDS_QUERY = """
+    UPDATE scrape_shards
+    SET `Status` = 'pending', `Owner` = NULL, `LeaseExpiresAt` = NULL, `Attempts` = 0,
+        `StartedAt` = NULL, `CompletedAt` = NULL
+"""
+
+# A single UPDATE claims a shard atomically, so two workers can never lease the same one
+CLAIM_SHARD_QUERY = """
+    UPDATE scrape_shards
+    SET `Status` = 'leased', `Owner` = %(owner)s,
+        `LeaseExpiresAt` = NOW() + INTERVAL %(lease_seconds)s SECOND,
+        `Attempts` = `Attempts` + 1, `StartedAt` = COALESCE(`StartedAt`, NOW())
+    WHERE `Attempts` < %(max_attempts)s
+      AND (`Status` = 'pending' OR (`Status` = 'leased' AND `LeaseExpiresAt` < NOW()))
+    ORDER BY `ShardKey`
+    LIMIT 1
+"""
+
+LEASED_SHARD_QUERY = """
+    SELECT `ShardKey`, `StartedAt`, `Attempts` FROM scrape_shards
+    WHERE `Owner` = %s AND `Status` = 'leased'
+"""
+
+HEARTBEAT_QUERY = """
+    UPDATE scrape_shards SET `LeaseExpiresAt` = NOW() + INTERVAL %s SECOND
+    WHERE `ShardKey` = %s AND `Owner` = %s AND `Status` = 'leased'
+"""
+
+COMPLETE_SHARD_QUERY = """
+    UPDATE scrape_shards SET `Status` = 'done', `Owner` = NULL, `LeaseExpiresAt` = NULL, `CompletedAt` = NOW()
+    WHERE `ShardKey` = %s AND `Owner` = %s
+"""
+
+RELEASE_SHARD_QUERY = """
+    UPDATE scrape_shards
+    SET `Status` = IF(`Attempts` >= %s, 'failed', 'pending'), `Owner` = NULL, `LeaseExpiresAt` = NULL
+    WHERE `ShardKey` = %s AND `Owner` = %s
+"""
+
+
+# A shard leased by this worker. A shard leased before (by a worker that died or failed)
+# is resumed: PINs stored since resume_since are skipped.
+class ShardLease:
+    def __init__(self, key, started_at, attempts):
+        self.key = key
+        self.resume_since = started_at if attempts > 1 else None
+        self.attempts = attempts
+
+
+# Function to build a worker id that is unique across hosts and processes
+def default_owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def _execute(connection, query, params=None):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        connection.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+# Function to create the shard table and add any shard not in it yet
+def ensure_shards(connection):
+    _execute(connection, SCRAPE_SHARDS_DDL)
+    _execute(connection, SEED_SHARDS_QUERY)
+
+
+# Function to start a new crawl: every shard goes back to pending
+def reset_shards(connection):
+    _execute(connection, RESET_SHARDS_QUERY)
+
+
+# Function to lease the next pending (or expired) shard; returns a ShardLease or None when none is left
+def claim_shard(connection, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+    claimed = _execute(connection, CLAIM_SHARD_QUERY, {
+        'owner': owner,
+        'lease_seconds': lease_seconds,
+        'max_attempts': MAX_ATTEMPTS,
+    })
+    if not claimed:
+        return None
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(LEASED_SHARD_QUERY, (owner,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return ShardLease(*row) if row else None
+
+
+# Function to mark a leased shard as done
+def complete_shard(connection, lease, owner):
+    _execute(connection, COMPLETE_SHARD_QUERY, (lease.key, owner))
+
+
+# Function to hand a shard back after a failure, so another worker (or this one) retries it
+def release_shard(connection, lease, owner):
+    _execute(connection, RELEASE_SHARD_QUERY, (MAX_ATTEMPTS, lease.key, owner))
+
+
+# Keeps a lease alive from a background thread, on its own connection, while the shard is scraped.
+# If the lease was lost (it expired and another worker took the shard) the lost event is set, so the
+# scrape can stop taking new PINs from the shard.
+class ShardHeartbeat:
+    def __init__(self, connection_factory, lease, owner, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.connection_factory = connection_factory
+        self.lease = lease
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'heartbeat-{lease.key}', daemon=True)
+
+    def _run(self):
+        connection = None
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if connection is None:
+                    connection = self.connection_factory()
+                if not _execute(connection, HEARTBEAT_QUERY, (self.lease_seconds, self.lease.key, self.owner)):
+                    logger.warning("Lost the lease on shard %04d", self.lease.key)
+                    self.lost.set()
+                    break
+            except Exception as e:
+                # A missed heartbeat is not fatal until the lease actually expires
+                logger.warning("Heartbeat for shard %04d failed: %s", self.lease.key, e)
+                connection = None
+        if connection is not None:
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300  # Seconds a result is served from the cache
+DEFAULT_MAX_ENTRIES = 10000  # Results kept; the least recently used go first
+
+HIT, MISS, COALESCED = 'hit', 'miss', 'coalesced'
+
+
+# One in-flight call that followers wait on
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+# Runs func at most once at a time per key and keeps its results for ttl seconds.
+# A caller arriving while the key's call is under way waits for that call's result instead of making its
+# own (coalesced); one arriving within ttl of a cached result gets it at once (hit). Only results that
+# cacheable(value) accepts are kept; errors are passed to every waiting caller and never cached.
+class SingleFlightCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, cacheable=None, metrics=None,
+                 name='cache'):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cacheable = cacheable or (lambda value: True)
+        self.metrics = metrics
+        self.name = name
+        self._results = OrderedDict()  # key -> (expires at, value)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _count(self, outcome):
+        if self.metrics is not None:
+            self.metrics.inc(f'{self.name}_requests_total', result=outcome)
+
+    # Function to get key's result: cached, from the call already running for it, or by calling func().
+    # Returns (value, 'hit' | 'miss' | 'coalesced').
+    def get(self, key, func):
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    self._results.move_to_end(key)
+                    self._count(HIT)
+                    return cached[1], HIT
+                del self._results[key]
+
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+
+        if not leader:
+            self._count(COALESCED)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, COALESCED
+
+        self._count(MISS)
+        try:
+            call.value = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if call.error is None and self.ttl > 0 and self.cacheable(call.value):
+                    self._results[key] = (time.monotonic() + self.ttl, call.value)
+                    if len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.value, MISS
+
+    # Function to drop key's cached result, so the next caller scrapes again
+    def forget(self, key):
+        with self._lock:
+            self._results.pop(key, None)
@@ -0,0 +1,168 @@
+import logging
+import os
+import tempfile
+import threading
+
+from property_record import COLUMN_NAMES
+from property_upsert import build_upsert_query, upsert_rows
+from scrape_logging import SUMMARY
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = 'property_details_staging'  # Built by a full refresh, then swapped in
+RETIRED_TABLE = 'property_details_old'  # The table a swap replaced, dropped straight after
+STATE_STAGING_TABLE = 'property_scrape_state_staging'  # Scrape state recorded by a full refresh
+RETIRED_STATE_TABLE = 'property_scrape_state_old'
+LOAD_METHODS = ('insert', 'load-data')
+DEFAULT_LOAD_METHOD = 'insert'
+STAGING_BATCH_SIZE = 5000  # Rows per batch when loading the staging table; nothing reads it yet
+CARRY_OVER_BATCH_SIZE = 1000  # PINs per statement copying live rows into the staging table
+
+# Rows go into the staging table with the same statement as the live one; a PIN seen twice keeps its last row
+STAGING_QUERY = build_upsert_query(STAGING_TABLE)
+
+# Bulk load of the spooled rows; REPLACE keeps the last row of a PIN seen twice, like the upsert
+LOAD_DATA_QUERY = rf"""
+    LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE {STAGING_TABLE}
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\t' ESCAPED BY '\\'
+    LINES TERMINATED BY '\n'
+    ({', '.join(f'`{name}`' for name in COLUMN_NAMES)})
+"""
+
+# All renames happen in one atomic statement: readers see the old table or the new one, never neither,
+# and the scrape state always describes the rows in property_details
+SWAP_QUERY = (f"RENAME TABLE property_details TO {RETIRED_TABLE}, "
+              f"{STAGING_TABLE} TO property_details, "
+              f"property_scrape_state TO {RETIRED_STATE_TABLE}, "
+              f"{STATE_STAGING_TABLE} TO property_scrape_state")
+
+# Live rows of PINs whose page is gone are copied into the staging table, unless it has a row for them
+CARRY_OVER_QUERY = f"INSERT IGNORE INTO {STAGING_TABLE} SELECT * FROM property_details WHERE Pin IN ({{}})"
+
+
+# Function to write one value in the LOAD DATA text format (\N is NULL; backslash, tab and newlines escaped)
+def _spool_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+# Function to run one statement; returns its first row when fetch is set
+def _execute(connection, query, params=None, fetch=False):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        row = cursor.fetchone() if fetch else None
+        if not connection.autocommit:
+            connection.commit()
+        return row
+    finally:
+        cursor.close()
+
+
+# Loads a full refresh into property_details_staging and swaps it in atomically when the run succeeds.
+# The live table is not written to at all until the swap, so API reads never wait on the refresh.
+# Neither is property_scrape_state: the refresh records its PINs in a copy of it (STATE_STAGING_TABLE,
+# state_table) that is swapped in with the rows, so a refresh that crashes or rolls back leaves no
+# state describing rows that were never swapped in.
+# method 'insert' sends large multi-row INSERTs through the executor; 'load-data' spools the rows to a
+# file in spool_dir and bulk-loads it with LOAD DATA LOCAL INFILE at the end (the connection must
+# allow it, e.g. allow_local_infile_in_path=spool_dir).
+# PINs whose page is gone for good (carry_over) keep their live row: it is copied in before the swap.
+class StagingLoad:
+    def __init__(self, executor, method=DEFAULT_LOAD_METHOD, spool_dir=None):
+        if method not in LOAD_METHODS:
+            raise ValueError(f"Unknown load method {method!r}, expected one of {', '.join(LOAD_METHODS)}")
+        self.executor = executor
+        self.method = method
+        self.spool_dir = spool_dir
+        self.state_table = STATE_STAGING_TABLE
+        self.rows = 0
+        self.carried_pins = []
+        self._spool = None
+        self._lock = threading.Lock()
+
+    # Function to create an empty staging table shaped like property_details, and a copy of the scrape state
+    def begin(self, connection):
+        for table in (STAGING_TABLE, STATE_STAGING_TABLE):
+            _execute(connection, f"DROP TABLE IF EXISTS {table}")
+        _execute(connection, f"CREATE TABLE {STAGING_TABLE} LIKE property_details")
+        _execute(connection, f"CREATE TABLE {STATE_STAGING_TABLE} LIKE property_scrape_state")
+        _execute(connection, f"INSERT INTO {STATE_STAGING_TABLE} SELECT * FROM property_scrape_state")
+        if self.method == 'load-data':
+            self._spool = tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='\n', suffix='.tsv',
+                                                      prefix='property_details_', dir=self.spool_dir,
+                                                      delete=False)
+        logger.info("Full refresh: loading %s (%s)", STAGING_TABLE, self.method)
+
+    # Function to stage a batch of PropertyDetail rows; on_batch(cursor, rows) records their scrape state.
+    # Returns the rows that could not be written.
+    def write(self, rows, on_batch=None):
+        if self.method == 'insert':
+            failed = upsert_rows(self.executor, rows, query=STAGING_QUERY, batch_size=STAGING_BATCH_SIZE,
+                                 on_batch=on_batch)
+            with self._lock:
+                self.rows += len(rows) - len(failed)
+            return failed
+
+        lines = ''.join('\t'.join(_spool_value(value) for value in row.as_params()) + '\n' for row in rows)
+        with self._lock:
+            self._spool.write(lines)
+            self.rows += len(rows)
+        if on_batch is not None:
+            self.executor.run(lambda connection: self._record(connection, rows, on_batch))
+        return []
+
+    # Function to keep the live row of a PIN the refresh has no page for. pin is the property_details.Pin,
+    # i.e. a 10-digit properties.PIN padded to 14 digits (pad_pin, DETAILS_PIN_EXPR).
+    def carry_over(self, pin):
+        with self._lock:
+            self.carried_pins.append(int(pin))
+
+    @staticmethod
+    def _record(connection, rows, on_batch):
+        cursor = connection.cursor()
+        try:
+            on_batch(cursor, rows)
+            if not connection.autocommit:
+                connection.commit()
+        finally:
+            cursor.close()
+
+    # Function to bulk-load the spool (load-data), then swap the staging table in and drop the old one
+    def finish(self, connection):
+        if self._spool is not None:
+            self._spool.close()
+            _execute(connection, LOAD_DATA_QUERY, (self._spool.name,))
+            os.remove(self._spool.name)
+            self._spool = None
+
+        for start in range(0, len(self.carried_pins), CARRY_OVER_BATCH_SIZE):
+            pins = self.carried_pins[start:start + CARRY_OVER_BATCH_SIZE]
+            _execute(connection, CARRY_OVER_QUERY.format(', '.join(['%s'] * len(pins))), pins)
+        if self.carried_pins:
+            logger.warning("Full refresh: kept the current rows of %d PINs with no page", len(self.carried_pins),
+                           extra=SUMMARY)
+
+        staged = _execute(connection, f"SELECT COUNT(*) FROM {STAGING_TABLE}", fetch=True)[0]
+        if not staged:
+            raise RuntimeError(f"{STAGING_TABLE} is empty, not swapping it in")
+
+        for table in (RETIRED_TABLE, RETIRED_STATE_TABLE):
+            _execute(connection, f"DROP TABLE IF EXISTS {table}")
+        _execute(connection, SWAP_QUERY)
+        for table in (RETIRED_TABLE, RETIRED_STATE_TABLE):
+            _execute(connection, f"DROP TABLE {table}")
+        logger.info("Full refresh: %d rows swapped into property_details", staged, extra=SUMMARY)
+
+    # Function to abandon the refresh: the live table is untouched, the staging table and spool are dropped
+    def rollback(self, connection):
+        if self._spool is not None:
+            self._spool.close()
+            os.remove(self._spool.name)
+            self._spool = None
+        for table in (STAGING_TABLE, STATE_STAGING_TABLE):
+            _execute(connection, f"DROP TABLE IF EXISTS {table}")
+        logger.warning("Full refresh rolled back; property_details is unchanged", extra=SUMMARY)
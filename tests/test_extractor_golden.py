@@ -0,0 +1,31 @@
+# Golden-file tests of the extractor: every backend must reproduce benchmarks/pages/<page>.json exactly.
+# Run from the repository root:  python -m pytest
+# After adding a page, write its golden file with:  python -m benchmarks.bench_parse --update-golden
+import json
+
+import pytest
+
+import extractor
+from extractor import BACKENDS, parse_property_page
+from property_record import COLUMN_NAMES
+from benchmarks.bench_parse import GOLDEN_PIN, golden_path, load_pages
+
+PAGES = load_pages()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('name, html_text', PAGES, ids=[name for name, _ in PAGES])
+def test_backend_matches_golden_file(name, html_text, backend):
+    if backend == 'lxml' and extractor.lxml is None:
+        pytest.skip('lxml is not installed')
+    with open(golden_path(name), encoding='utf-8') as f:
+        # Columns missing from a golden file were not on the page
+        expected = dict.fromkeys(COLUMN_NAMES)
+        expected.update(json.load(f))
+
+    assert parse_property_page(html_text, GOLDEN_PIN, backend).to_dict() == expected
+
+
+# Without pages the test above would be skipped, not failed
+def test_pages_are_found():
+    assert PAGES